@@ -1,8 +1,27 @@
-from core.packer import Pack
+from core.packer import Pack, register_cooker
+from rendering.mesh_data import cook_obj, COOKED_MESH_SUFFIX, COOKED_MESH_VERSION
+from rendering.texture_data import bake_texture, BAKED_TEXTURE_SUFFIX, BAKED_TEXTURE_VERSION
 
-import os
+import os, sys, functools
 
-def build_game():
+# Meshes are parsed once here and shipped as GPU-ready, vertex cache optimized buffers instead of OBJ text,
+# in the compact vertex layout (quantized normals, half float uvs) with --compact-vertices.
+# --optimize-overdraw also sorts triangle clusters to cut overdraw, --no-lods skips generating LOD levels.
+# The options are part of the cook fingerprint, so incremental builds re-cook every mesh when they're toggled.
+mesh_stats = []
+mesh_options = {
+    "compact": "--compact-vertices" in sys.argv,
+    "overdraw": "--optimize-overdraw" in sys.argv,
+    "lods": "--no-lods" not in sys.argv
+}
+mesh_fingerprint = f"rmesh{COOKED_MESH_VERSION} " + " ".join(f"{option}={value}" for option, value in mesh_options.items())
+register_cooker(".obj", COOKED_MESH_SUFFIX, functools.partial(cook_obj, **mesh_options, stats=mesh_stats), mesh_fingerprint)
+
+# Textures are decoded and mipmapped here so the game uploads raw RGBA levels
+for extension in (".png", ".jpg", ".jpeg"):
+    register_cooker(extension, BAKED_TEXTURE_SUFFIX, bake_texture, f"rtex{BAKED_TEXTURE_VERSION}")
+
+def build_game(incremental: bool = False):
     print("Building the game...")
 
     # # Build the executable using PyInstaller
@@ -14,10 +33,33 @@ def build_game():
 
     print("Writing asset packs...")
 
-    # Pack the game assets
-    Pack.write_packs()
+    # Pack the game assets, only repacking what changed since the last build when incremental
+    stats = Pack.write_packs(incremental=incremental)
+    print(f"Packed {stats['written']} assets, reused {stats['reused']}, removed {stats['removed']}, deduplicated {stats['deduplicated']}.")
+    print_mesh_stats()
 
     print("Game built successfully!")
 
+def print_mesh_stats():
+    if not mesh_stats:
+        return
+
+    # Triangle weighted, so large meshes count for what they cost
+    triangles = sum(submesh.triangles for submesh in mesh_stats)
+    before = sum(submesh.acmr_before * submesh.triangles for submesh in mesh_stats) / max(triangles, 1)
+    after = sum(submesh.acmr_after * submesh.triangles for submesh in mesh_stats) / max(triangles, 1)
+    print(f"Optimized {len(mesh_stats)} submeshes ({triangles} triangles), ACMR {before:.3f} -> {after:.3f}.")
+
+def build_layer(layer_name: str):
+    print(f"Packing layer {layer_name}...")
+
+    # Only assets that differ from the last full build go in the layer
+    stats = Pack.write_layer(layer_name)
+    print(f"Packed {stats['written']} changed assets, skipped {stats['unchanged']} unchanged.")
+    print_mesh_stats()
+
 if __name__ == "__main__":
-    build_game()
\ No newline at end of file
+    if "--layer" in sys.argv:
+        build_layer(sys.argv[sys.argv.index("--layer") + 1])
+    else:
+        build_game(incremental="--incremental" in sys.argv)
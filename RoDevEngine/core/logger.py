@@ -1,14 +1,16 @@
 from __future__ import annotations
-import os, enum, colorama
+import os, enum, colorama, multiprocessing
 from pathlib import Path
 
 if not os.path.isdir("logs"):
-    os.makedirs("logs")
+    os.makedirs("logs", exist_ok=True)
 
-if os.path.isfile("logs/last_log.log"):
-    os.remove("logs/last_log.log")
-if os.path.isfile("logs/latest.log"):
-    os.rename("logs/latest.log", "logs/last_log.log")
+# Worker processes (scene loading) append to the main process' log instead of rotating it
+if multiprocessing.parent_process() is None:
+    if os.path.isfile("logs/last_log.log"):
+        os.remove("logs/last_log.log")
+    if os.path.isfile("logs/latest.log"):
+        os.rename("logs/latest.log", "logs/last_log.log")
 
 _log_file = open("logs/latest.log", "a+")
 
@@ -4,14 +4,510 @@ from .logger import Logger
 
 import io
 
+from dataclasses import dataclass
+
 import os
+import mmap
 import struct
 import json
+import hashlib
+import zlib
+import lzma
+
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import threading
+
+MASTER_VERSION = 2
+PACK_VERSION = 2
+MANIFEST_VERSION = 1
+
+PACK_NAMES = ("pak_0.rpk", "pak_1.rpk")
+MANIFEST_PATH = "pak_manifest.json"
+
+# Entry of the base game holding its build id, a digest of every asset's content
+BUILD_ID_ENTRY = "__build_id__"
+# Entry every layer carries with the build id of the base game it was built against
+LAYER_BASE_ENTRY = "__layer_base__"
+# Layer names that would overwrite the base game's files
+_RESERVED_LAYER_NAMES = ("master",)
+
+# v2 master: header, pack table, open-addressed hash index of fixed size slots, then a blob of entry names.
+# Header: magic (4s), version (H), pack count (H), entry count (Q), slot count (Q), slots offset (Q), names offset (Q)
+_MASTER_HEADER = struct.Struct("<4sHHQQQQ")
+# Slot: name hash (Q), data offset (Q), data size (Q), name offset (Q), name length (H), pack index (H), flags (H), reserved (H)
+_SLOT = struct.Struct("<QQQQHHHH")
+_EMPTY_SLOT = 0xFFFF
+
+# v2 pack: magic (4s), version (H), reserved (H), asset count (Q), followed by raw asset blobs
+_PACK_HEADER = struct.Struct("<4sHHQ")
+
+# Blobs start on this boundary so mapped views can be handed to NumPy/GL as is
+_ALIGNMENT = 16
+
+# Per-entry codec, stored in the low bits of the slot flags
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+_CODEC_MASK = 0x000F
+
+# Formats that are already compressed gain nothing from another pass
+# Cooked meshes and baked textures are stored raw too, so they can be viewed in place out of the mapped pack.
+_STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".ogg", ".mp3", ".zip", ".rmesh", ".rtex")
+_TEXT_EXTENSIONS = (".obj", ".mtl", ".rscene", ".rmat", ".rshader", ".vert", ".frag", ".json", ".py")
+
+# Below this nothing is compressed, above LZMA_THRESHOLD text assets use lzma instead of zlib
+COMPRESS_THRESHOLD = 512
+LZMA_THRESHOLD = 256 * 1024
+# Compressed entries at least this big are decoded incrementally by get_io
+STREAM_THRESHOLD = 1024 * 1024
+_STREAM_CHUNK = 64 * 1024
+_WRITE_BUFFER = 1024 * 1024
+
+def _normalize_name(asset_name: str) -> str:
+    return asset_name.replace("/", "\\")
+
+def _build_id(assets: dict[str, dict]) -> str:
+    # Changes whenever any asset's content or cook does, and only then, whether the build was full or incremental
+    contents = json.dumps({name: [record["hash"], record.get("cook")] for name, record in sorted(assets.items())})
+    return hashlib.blake2b(contents.encode("utf-8"), digest_size=16).hexdigest()
+
+def _hash_name(name: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), "little")
+
+def _choose_codec(asset_name: str, size: int) -> int:
+    if size < COMPRESS_THRESHOLD or asset_name.lower().endswith(_STORED_EXTENSIONS):
+        return CODEC_NONE
+
+    if size >= LZMA_THRESHOLD and asset_name.lower().endswith(_TEXT_EXTENSIONS):
+        return CODEC_LZMA
+
+    return CODEC_ZLIB
+
+def _compress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 9)
+    if codec == CODEC_LZMA:
+        return lzma.compress(data)
+    return data
+
+def _decompress(data, codec: int) -> bytes:
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_LZMA:
+        return lzma.decompress(data)
+    raise ValueError(f"Unknown pack codec {codec}.")
+
+def encode_asset(asset_name: str, data: bytes) -> tuple[bytes, int]:
+    """
+        Compresses an asset with the codec picked for its type and size. \n
+        Returns the bytes to store and the codec, falling back to storing raw data when compression doesn't pay off.
+    """
+    codec = _choose_codec(asset_name, len(data))
+    if codec == CODEC_NONE:
+        return data, CODEC_NONE
+
+    compressed = _compress(data, codec)
+    if len(compressed) > len(data) * 0.9:
+        return data, CODEC_NONE
+
+    return compressed, codec
+
+def _blob_key(record: dict) -> str:
+    # Identical sources only share a blob if they were stored the same way, cooked or not
+    return record["hash"] + os.path.splitext(record.get("entry", ""))[1] + record.get("cook", "")
+
+# Source extension -> (suffix of the cooked asset's name, cook function taking and returning bytes, fingerprint)
+_cookers: dict[str, tuple[str, object, str]] = {}
+
+def register_cooker(extension: str, suffix: str, cook, fingerprint: str = ""):
+    """
+        Registers a build step for assets with the given extension. \n
+        Their cooked output is packed under the source name plus suffix, in place of the source file. \n
+        fingerprint identifies the cooked output format and the cook options. It's saved with every cooked asset in
+        the build manifest, and assets cooked with a different one are re-cooked by incremental builds and layers.
+    """
+    _cookers[extension.lower()] = (suffix, cook, fingerprint)
+
+def _cook_fingerprint(asset_path: str) -> str | None:
+    # None for assets packed as they are
+    cooker = _cookers.get(os.path.splitext(asset_path)[1].lower())
+    return cooker[2] if cooker else None
+
+def _read_and_encode(asset_path: str) -> tuple[dict, bytes]:
+    """
+        Build worker: returns the asset's manifest record (without its location) and the bytes to store.
+    """
+    stat = os.stat(asset_path)
+    with open(asset_path, "rb") as f:
+        data = f.read()
+
+    record = {
+        "hash": hashlib.blake2b(data, digest_size=16).hexdigest(),
+        "size": len(data),
+        "mtime": stat.st_mtime_ns
+    }
+
+    entry_name = asset_path
+    cooker = _cookers.get(os.path.splitext(asset_path)[1].lower())
+    if cooker:
+        suffix, cook, fingerprint = cooker
+        entry_name = asset_path + suffix
+        record["entry"] = _normalize_name(entry_name)
+        record["cook"] = fingerprint
+        data = cook(data)
+
+    stored_data, codec = encode_asset(entry_name, data)
+    record.update({"stored_size": len(stored_data), "flags": codec})
+
+    return record, stored_data
+
+@dataclass(frozen=True)
+class PackEntry:
+    file: str
+    offset: int
+    size: int
+    flags: int = 0
+
+    @property
+    def codec(self) -> int:
+        return self.flags & _CODEC_MASK
+
+class AssetReader(io.RawIOBase):
+    """
+        Read-only, seekable file object over a memoryview. \n
+        Lets loaders that want a file (PIL, json.load, ...) read straight out of a mapped pack without copying the asset first.
+    """
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence value: {whence}")
+
+        if pos < 0:
+            raise ValueError("Negative seek position.")
+
+        self._pos = pos
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        start = min(self._pos, len(self._view))
+        end = min(start + len(buffer), len(self._view))
+        buffer[:end - start] = self._view[start:end]
+        self._pos = end
+        return end - start
+
+    def read(self, size: int = -1) -> bytes:
+        start = min(self._pos, len(self._view))
+        end = len(self._view) if size is None or size < 0 else min(start + size, len(self._view))
+        self._pos = end
+        return self._view[start:end].tobytes()
+
+    def readall(self) -> bytes:
+        return self.read()
+
+class DecompressingReader(io.RawIOBase):
+    """
+        Read-only file object that decodes a compressed asset in chunks as it is read. \n
+        Only one chunk of compressed and decompressed data is held at a time. Seeking backwards restarts decoding.
+    """
+    def __init__(self, view: memoryview, codec: int):
+        self._view = view
+        self._codec = codec
+        self._restart()
+
+    def _restart(self):
+        self._decompressor = zlib.decompressobj() if self._codec == CODEC_ZLIB else lzma.LZMADecompressor()
+        self._src_pos = 0
+        self._pos = 0
+
+    def _next_input(self):
+        chunk = self._view[self._src_pos:self._src_pos + _STREAM_CHUNK]
+        self._src_pos += len(chunk)
+        return chunk
+
+    def _decode(self, max_length: int) -> bytes:
+        decompressor = self._decompressor
+        while not decompressor.eof:
+            if self._codec == CODEC_ZLIB:
+                data = decompressor.unconsumed_tail or self._next_input()
+            else:
+                data = self._next_input() if decompressor.needs_input else b""
+
+            if not data and self._src_pos >= len(self._view) and (self._codec == CODEC_ZLIB or decompressor.needs_input):
+                # Input is exhausted, flush whatever is left
+                return decompressor.flush() if self._codec == CODEC_ZLIB else b""
+
+            out = decompressor.decompress(data, max_length)
+            if out:
+                return out
+
+        return b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            # The decoded size isn't stored, so find the end by decoding to it
+            while self.read(_STREAM_CHUNK):
+                pass
+            pos = self._pos + offset
+        else:
+            raise ValueError(f"Invalid whence value: {whence}")
+
+        if pos < 0:
+            raise ValueError("Negative seek position.")
+
+        if pos < self._pos:
+            self._restart()
+
+        while self._pos < pos:
+            if not self.read(min(pos - self._pos, _STREAM_CHUNK)):
+                break
+
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        out = self._decode(len(buffer))
+        buffer[:len(out)] = out
+        self._pos += len(out)
+        return len(out)
+
+class AssetCache:
+    """
+        LRU cache of decoded assets with a byte budget. \n
+        Values are keyed by (kind, PackEntry), so names that share a blob also share the decoded value.
+        Hits and misses are counted per kind.
+    """
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.used = 0
+        self.hits : dict[str, int] = {}
+        self.misses : dict[str, int] = {}
+        self._items : OrderedDict[tuple[str, PackEntry], tuple[object, int]] = OrderedDict()
+
+        # Prefetch workers fill the cache from other threads. Decoding happens outside the lock.
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, entry: PackEntry, decode):
+        """
+            Returns the cached value, or calls decode() -> (value, cost in bytes) and caches the result.
+        """
+        key = (kind, entry)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits[kind] = self.hits.get(kind, 0) + 1
+                return item[0]
+
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+
+        value, cost = decode()
+
+        # Anything bigger than the whole budget would just flush the cache
+        if cost <= self.budget:
+            with self._lock:
+                if key not in self._items:
+                    self._items[key] = (value, cost)
+                    self.used += cost
+                    self._trim()
+
+        return value
+
+    def _trim(self):
+        while self.used > self.budget and self._items:
+            _, (_, cost) = self._items.popitem(last=False)
+            self.used -= cost
+
+    def trim(self):
+        with self._lock:
+            self._trim()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.used = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "used": self.used,
+                "entries": len(self._items),
+                "hits": dict(self.hits),
+                "misses": dict(self.misses)
+            }
+
+class PackLayer:
+    """
+        One mounted master file (the base game, a DLC or a patch) and the index of the packs it points into.
+    """
+    def __init__(self, master_path: str, map_pack):
+        self.master_path = master_path
+
+        with open(master_path, "rb") as master_pak:
+            self._master = mmap.mmap(master_pak.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.version = struct.unpack_from("<4sH", self._master, 0)
+        if magic != b"RPKM":
+            raise ValueError(f"Invalid pak master file {master_path}.")
+
+        if self.version == 1:
+            self._read_toc_v1(map_pack)
+        elif self.version == 2:
+            self._read_index_v2(map_pack)
+        else:
+            raise ValueError(f"Unsupported pak master version {self.version} in {master_path}.")
+
+    def _read_toc_v1(self, map_pack):
+        """
+            v1 masters are a flat list of (name, pack, offset), so they have to be decoded up front.
+        """
+        master = self._master
+        _, _, entry_count, _ = struct.unpack_from("<4sHHH", master, 0)
+        offset = 10
+
+        self.toc = {}
+        self._pack_views : dict[str, memoryview] = {}
+        for _ in range(entry_count):
+            name_length = struct.unpack_from("<H", master, offset)[0]
+            name = master[offset + 2:offset + 2 + name_length].decode()
+            offset += 2 + name_length
+            file_length = struct.unpack_from("<H", master, offset)[0]
+            file_name = master[offset + 2:offset + 2 + file_length].decode()
+            offset += 2 + file_length
+            entry_offset = struct.unpack_from("<I", master, offset)[0]
+            offset += 4
+
+            self.toc[name] = {"file": file_name, "offset": entry_offset}
+            if file_name not in self._pack_views:
+                self._pack_views[file_name] = map_pack(file_name)
+
+    def _read_index_v2(self, map_pack):
+        """
+            v2 masters carry a prebuilt hash index, so only the header and pack table are read here.
+            Entries are decoded on first use.
+        """
+        (_, _, pack_count, self._entry_count, self._slot_count,
+         self._slots_offset, self._names_offset) = _MASTER_HEADER.unpack_from(self._master, 0)
+
+        self._pack_names : list[str] = []
+        offset = _MASTER_HEADER.size
+        for _ in range(pack_count):
+            name_length = struct.unpack_from("<H", self._master, offset)[0]
+            file_name = self._master[offset + 2:offset + 2 + name_length].decode()
+            offset += 2 + name_length
+
+            self._pack_names.append(file_name)
+            map_pack(file_name)
+
+    def _find_slot(self, name: bytes):
+        mask = self._slot_count - 1
+        name_hash = _hash_name(name)
+        index = name_hash & mask
+
+        # Linear probing, the index is written at <= 50% load so chains stay short
+        while True:
+            slot = _SLOT.unpack_from(self._master, self._slots_offset + index * _SLOT.size)
+            slot_hash, _, _, name_offset, name_length, pack_index, _, _ = slot
+            if pack_index == _EMPTY_SLOT:
+                return None
+
+            if slot_hash == name_hash and name_length == len(name):
+                start = self._names_offset + name_offset
+                if self._master[start:start + name_length] == name:
+                    return slot
+
+            index = (index + 1) & mask
+
+    def _entry_from_slot(self, slot) -> PackEntry:
+        _, offset, size, _, _, pack_index, flags, _ = slot
+        return PackEntry(self._pack_names[pack_index], offset, size, flags)
+
+    def find(self, asset_name: str) -> PackEntry | None:
+        """
+            Looks up a normalized asset name in this layer. Returns None if the layer doesn't have it.
+        """
+        if self.version == 1:
+            if asset_name not in self.toc:
+                return None
+
+            # v1 entries are prefixed with [name_length (H)][name bytes][data_length (I)] inside the pack
+            toc_entry = self.toc[asset_name]
+            view = self._pack_views[toc_entry["file"]]
+            offset = toc_entry["offset"]
+            name_length = struct.unpack_from("<H", view, offset)[0]
+            offset += 2 + name_length
+            data_length = struct.unpack_from("<I", view, offset)[0]
+            return PackEntry(toc_entry["file"], offset + 4, data_length)
+
+        slot = self._find_slot(asset_name.encode("utf-8"))
+        if slot is None:
+            return None
+
+        return self._entry_from_slot(slot)
+
+    def entries(self) -> dict[str, PackEntry]:
+        """
+            Decodes every entry of the layer. Used to merge overlay layers and to list files.
+        """
+        if self.version == 1:
+            return {name: self.find(name) for name in self.toc.keys()}
+
+        entries = {}
+        for index in range(self._slot_count):
+            slot = _SLOT.unpack_from(self._master, self._slots_offset + index * _SLOT.size)
+            _, _, _, name_offset, name_length, pack_index, _, _ = slot
+            if pack_index == _EMPTY_SLOT:
+                continue
+
+            start = self._names_offset + name_offset
+            entries[self._master[start:start + name_length].decode("utf-8")] = self._entry_from_slot(slot)
+
+        return entries
 
 class Pack:
     _instance = None
     _initalized = False
 
+    # Byte budget of the decoded asset cache, change it at runtime with set_cache_budget
+    CACHE_BUDGET = 64 * 1024 * 1024
+
+    # Threads used by prefetch/get_async
+    PREFETCH_WORKERS = 4
+
+    BASE_MASTER = "pak_master.mrpk"
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(Pack, cls).__new__(cls)
@@ -19,162 +515,591 @@ class Pack:
 
     def __init__(self):
         if not Pack._initalized:
-            self.files : list[str] = []
-            with open("pak_master.mrpk", "rb") as master_pak:
-                # Read and validate header
-                header_struct = struct.Struct("<4sHHH")
-                magic, version, entry_count, packs_offset = header_struct.unpack(master_pak.read(header_struct.size))
-                if magic != b"RPKM":
-                    raise ValueError("Invalid pak master file.")
-
-                # Read TOC entries
-                toc_entries = {}
-                for _ in range(entry_count):
-                    name_length = struct.unpack("<H", master_pak.read(2))[0]
-                    name = master_pak.read(name_length).decode()
-                    file_length = struct.unpack("<H", master_pak.read(2))[0]
-                    file_name = master_pak.read(file_length).decode()
-                    offset = struct.unpack("<I", master_pak.read(4))[0]
-                    toc_entries[name] = {"file": file_name, "offset": offset}
-
-                self.packs : dict[str, io.BufferedReader] = {}
-                for entry in toc_entries.values():
-                    if entry["file"] not in self.packs:
-                        self.packs[entry["file"]] = open(entry["file"], "rb")
-
-                self.toc = {name: entry for name, entry in toc_entries.items()}
-                self.files.extend([name for name in toc_entries.keys()])
+            # Map every pack once, assets are then sliced out of the mapping with no reads or copies
+            self.packs : dict[str, mmap.mmap] = {}
+            self._views : dict[str, memoryview] = {}
+
+            # Entries resolved so far, so the index is only probed once per asset
+            self._entries : dict[str, PackEntry] = {}
+            self._files : list[str] = None
+
+            self.cache = AssetCache(Pack.CACHE_BUDGET)
+            self._prefetch_pool : ThreadPoolExecutor = None
+
+            # The base layer is looked up through its own hash index. Entries of every layer mounted on top of it
+            # are merged into one dict, later layers overwriting earlier ones, so a lookup is one dict probe
+            # plus at most one index probe no matter how many layers are mounted.
+            self.layers : list[PackLayer] = [PackLayer(Pack.BASE_MASTER, self._map_pack)]
+            self._overrides : dict[str, PackEntry] = {}
+
+            # DLC and patch masters built with write_layer, mounted in name order
+            for file_name in sorted(os.listdir(".")):
+                if file_name.startswith("pak_") and file_name.endswith(".mrpk") and file_name != Pack.BASE_MASTER:
+                    self.mount(file_name)
 
         Pack._initalized = True
-    
-    def get(self, asset_name: str) -> bytes:
-        asset_name = asset_name.replace("/", "\\")
-        if asset_name not in self.toc:
-            raise ValueError(f"Asset {asset_name} not found in the Table of Contents...")
 
-        entry = self.toc[asset_name]
-        pack_file = self.packs[entry["file"]]
-        pack_file.seek(entry["offset"])
+    @property
+    def version(self) -> int:
+        return self.layers[0].version
+
+    def _map_pack(self, file_name: str) -> memoryview:
+        if file_name not in self.packs:
+            with open(file_name, "rb") as pack_file:
+                self.packs[file_name] = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._views[file_name] = memoryview(self.packs[file_name])
+
+        return self._views[file_name]
+
+    def mount(self, master_path: str) -> PackLayer | None:
+        """
+            Mounts a DLC or patch master on top of everything mounted so far. Its assets override earlier layers. \n
+            Layers built against a different base than the one mounted are skipped, their diff no longer applies.
+        """
+        layer = PackLayer(master_path, self._map_pack)
+
+        base_entry = layer.find(LAYER_BASE_ENTRY)
+        build_entry = self.layers[0].find(BUILD_ID_ENTRY)
+        if base_entry is None or build_entry is None or bytes(self._get_stored(base_entry)) != bytes(self._get_stored(build_entry)):
+            Logger("CORE").log_warning(f"Pack layer {master_path} was built against a different base game, not mounting it.")
+            return None
+
+        self.layers.append(layer)
+
+        entries = layer.entries()
+        entries.pop(LAYER_BASE_ENTRY)
+        self._overrides.update(entries)
+
+        # Anything resolved before this mount may now come from the new layer
+        self._entries.clear()
+        self._files = None
+        self.cache.clear()
+
+        Logger("CORE").log_debug(f"Mounted pack layer {master_path}.")
+        return layer
+
+    def _lookup(self, asset_name: str) -> PackEntry:
+        asset_name = _normalize_name(asset_name)
+        entry = self._entries.get(asset_name)
+        if entry is not None:
+            return entry
+
+        entry = self._overrides.get(asset_name)
+        if entry is None:
+            entry = self.layers[0].find(asset_name)
+            if entry is None:
+                raise ValueError(f"Asset {asset_name} not found in the Table of Contents...")
+
+        self._entries[asset_name] = entry
+        return entry
+
+    @property
+    def files(self) -> list[str]:
+        """
+            Every asset name across the mounted layers. For v2 masters this decodes the whole base index,
+            so it is only built when asked for.
+        """
+        if self._files is None:
+            self._files = sorted((set(self.layers[0].entries().keys()) | set(self._overrides.keys())) - {BUILD_ID_ENTRY})
+
+        return self._files
+
+    def has(self, asset_name: str) -> bool:
+        try:
+            self._lookup(asset_name)
+        except ValueError:
+            return False
 
-        name_length = struct.unpack("<H", pack_file.read(2))[0]
-        pack_file.read(name_length)  # Skip name
-        data_length = struct.unpack("<I", pack_file.read(4))[0]
-        data = pack_file.read(data_length)
+        return True
 
-        return data
+    def get_entry(self, asset_name: str) -> PackEntry:
+        """
+            Returns where an asset is stored. The entry changes whenever a mounted layer replaces the asset,
+            so it also works as the asset's version.
+        """
+        return self._lookup(asset_name)
+
+    def _get_stored(self, entry: PackEntry) -> memoryview:
+        return self._views[entry.file][entry.offset:entry.offset + entry.size]
+
+    def _get_decompressed(self, entry: PackEntry) -> bytes:
+        def decode():
+            data = _decompress(self._get_stored(entry), entry.codec)
+            return data, len(data)
+
+        return self.cache.get("bytes", entry, decode)
+
+    def get_view(self, asset_name: str) -> memoryview:
+        """
+            Returns a read-only memoryview of an asset, sliced straight out of the mapped pack. \n
+            No copy is made, so the view can be handed to NumPy (np.frombuffer), PIL or GL as is.
+            It stays valid for as long as the Pack is alive. Compressed entries are decoded (and cached) first.
+        """
+        entry = self._lookup(asset_name)
+        if entry.codec == CODEC_NONE:
+            return self._get_stored(entry)
+
+        return memoryview(self._get_decompressed(entry))
+
+    def get(self, asset_name: str) -> bytes:
+        """
+            Returns the asset's bytes. Prefer get_view when the data is only read.
+        """
+        entry = self._lookup(asset_name)
+        if entry.codec == CODEC_NONE:
+            return self._get_stored(entry).tobytes()
+
+        return self._get_decompressed(entry)
     
-    def get_io(self, asset_name: str):
-        data = io.BytesIO(self.get(asset_name))
+    def get_io(self, asset_name: str, stream: bool = False) -> AssetReader | DecompressingReader:
+        """
+            Returns a seekable file object for the asset. Large compressed entries are decoded while being read. \n
+            With stream, every compressed entry is, since a small compressed entry can still decode into a lot of data.
+        """
+        entry = self._lookup(asset_name)
+        if entry.codec == CODEC_NONE:
+            return AssetReader(self._get_stored(entry))
+
+        if stream or entry.size >= STREAM_THRESHOLD:
+            return DecompressingReader(self._get_stored(entry), entry.codec)
 
-        return data
+        return AssetReader(memoryview(self._get_decompressed(entry)))
     
     def get_string(self, asset_name: str) -> str:
-        data = self.get(asset_name)
-        return data.decode("utf-8")
+        entry = self._lookup(asset_name)
+
+        def decode():
+            data = str(self.get_view(asset_name), "utf-8")
+            return data, len(data)
+
+        return self.cache.get("str", entry, decode)
     
     def get_as_json_dict(self, asset_name: str) -> dict:
-        data = self.get(asset_name).decode()
-        json_data = json.loads(data)
+        """
+            Returns the asset parsed as JSON. Parsed data is cached, so the dict is shared between callers
+            and must be copied before being modified.
+        """
+        entry = self._lookup(asset_name)
+
+        def decode():
+            data = self.get_view(asset_name)
+            # Parsed size isn't known, so the source size stands in as the cost
+            return json.loads(str(data, "utf-8")), len(data)
+
+        json_data = self.cache.get("json", entry, decode)
         if not isinstance(json_data, dict):
             Logger("CORE").log_warning(f"File data at {asset_name} is not a dictionary!")
             return None
         
         return json_data
 
+    def _get_prefetch_pool(self) -> ThreadPoolExecutor:
+        if self._prefetch_pool is None:
+            self._prefetch_pool = ThreadPoolExecutor(max_workers=Pack.PREFETCH_WORKERS, thread_name_prefix="PackPrefetch")
+        return self._prefetch_pool
+
+    def _warm(self, asset_name: str):
+        entry = self._lookup(asset_name)
+        if entry.codec != CODEC_NONE:
+            # Decoded bytes land in the cache for the loader to pick up
+            self._get_decompressed(entry)
+            return
+
+        # Get the pages read in ahead of time so the main thread doesn't stall on disk reads.
+        # The mapping is read through slices, so there is no shared seek position to fight over.
+        pack = self.packs[entry.file]
+        start = entry.offset - entry.offset % mmap.PAGESIZE
+        if hasattr(pack, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            # The kernel reads the range in the background, nothing to wait on here
+            pack.madvise(mmap.MADV_WILLNEED, start, entry.offset + entry.size - start)
+            return
+
+        # No madvise (Windows), so fault the pages in by reading a byte from each. The strided copy
+        # does that in C, a Python loop per page would hold the GIL for the whole of a large asset
+        self._get_stored(entry)[::mmap.PAGESIZE].tobytes()
+
+    def prefetch(self, asset_names) -> list[Future]:
+        """
+            Loads assets in the background so later get* calls don't block on disk or decompression. \n
+            Returns one future per asset, resolving to None once it is warm. Unknown assets fail their future.
+        """
+        pool = self._get_prefetch_pool()
+        return [pool.submit(self._warm, asset_name) for asset_name in asset_names]
+
+    def get_async(self, asset_name: str) -> Future:
+        """
+            Returns a future resolving to the asset's bytes, read on a background thread.
+        """
+        return self._get_prefetch_pool().submit(self.get, asset_name)
+
+    def set_cache_budget(self, budget: int):
+        """
+            Sets the decoded asset cache's byte budget, evicting least recently used assets if it is now over.
+        """
+        Pack.CACHE_BUDGET = budget
+        self.cache.budget = budget
+        self.cache.trim()
+
+    def cache_stats(self) -> dict:
+        """
+            Returns the decoded asset cache's budget, bytes in use, entry count and per-kind hit/miss counters.
+        """
+        return self.cache.stats()
+
     @staticmethod
-    def write_packs():
+    def write_packs(incremental: bool = False, workers: int = None) -> dict:
         """
             Used when building a project made in the engine. \n
-            TODO: Add DLC Packing
+            Assets are compressed per entry, see encode_asset. A manifest of every asset's content hash and location
+            is written next to the packs. With incremental set, assets matching the manifest are left where they are,
+            changed ones are appended to the end of their pack and only the master is rewritten. \n
+            Assets are read and compressed on a pool of `workers` threads (defaults to the CPU count) and streamed to the
+            packs in a fixed order, so the output is deterministic and memory doesn't grow with the asset total. \n
+            Assets with identical content are stored once, every name pointing at the same blob. \n
+            Returns build stats: {"written": int, "reused": int, "removed": int, "deduplicated": int}. \n
+            DLC and patches are packed separately with write_layer.
         """
+        manifest = Pack._load_manifest() if incremental else None
+        if manifest is None:
+            return Pack._full_build(workers)
+
+        stats = Pack._incremental_build(manifest, workers)
+
+        # Relocated assets leave holes behind, repack once they outweigh the live data
+        for pack_name, pack_info in manifest["packs"].items():
+            if pack_info["garbage"] > pack_info["size"] // 2:
+                Logger("BUILD").log_info(f"{pack_name} is mostly stale data, doing a full rebuild.")
+                return Pack._full_build(workers)
+
+        return stats
+
+    @staticmethod
+    def write_layer(layer_name: str, asset_root: str = "assets/", workers: int = None) -> dict:
+        """
+            Packs a DLC or patch layer into pak_<layer_name>.mrpk and pak_<layer_name>_0.rpk. \n
+            Only assets under asset_root whose content differs from the base build's manifest are included,
+            so a patch holds just what changed. Layers are mounted on top of the base game in name order,
+            as long as it's the base they were built against. \n
+            Returns build stats: {"written": int, "unchanged": int, "deduplicated": int}.
+        """
+        if (not layer_name or layer_name in _RESERVED_LAYER_NAMES
+                or any(separator in layer_name for separator in ("/", "\\", os.sep))):
+            raise ValueError(f"Invalid layer name {layer_name!r}.")
+
+        # Layers only mount over the exact base they were diffed against
+        base_manifest = {}
+        if os.path.isfile(MANIFEST_PATH):
+            with open(MANIFEST_PATH) as manifest_file:
+                base_manifest = json.load(manifest_file)
+        if "build" not in base_manifest:
+            raise ValueError(f"No base build manifest found, build the game before packing {layer_name}.")
+
+        base_assets = base_manifest["assets"]
+        base_id = base_manifest["build"]["id"].encode("ascii")
+
+        stats = {"written": 0, "unchanged": 0, "deduplicated": 0}
+        pack_name = f"pak_{layer_name}_0.rpk"
+        toc_entries = []
+        blobs: dict[str, dict] = {}
+
+        with open(pack_name, "wb+", buffering=_WRITE_BUFFER) as pak_file:
+            pak_file.write(_PACK_HEADER.pack(b"RPK0", PACK_VERSION, 0, 0))
+
+            for asset_path, record, stored_data in Pack._encode_assets(Pack._walk_assets(asset_root), workers):
+                name = _normalize_name(asset_path)
+                base_record = base_assets.get(name)
+                if base_record and base_record["hash"] == record["hash"] and base_record.get("cook") == record.get("cook"):
+                    stats["unchanged"] += 1
+                    continue
+
+                record = Pack._store_record(pak_file, 0, record, stored_data, blobs, stats)
+                toc_entries.append({
+                    "name": record.get("entry", name).encode("utf-8"),
+                    "pack": 0,
+                    "offset": record["offset"],
+                    "size": record["stored_size"],
+                    "flags": record["flags"]
+                })
+
+            toc_entries.append({
+                "name": LAYER_BASE_ENTRY.encode("utf-8"),
+                "pack": 0,
+                "offset": Pack._write_blob(pak_file, base_id),
+                "size": len(base_id)
+            })
+
+            pak_file.seek(0)
+            pak_file.write(_PACK_HEADER.pack(b"RPK0", PACK_VERSION, 0, len(blobs) + 1))
+
+        Pack._write_master(f"pak_{layer_name}.mrpk", [pack_name], toc_entries)
+        return stats
+
+    @staticmethod
+    def _walk_assets(asset_root: str = "assets/") -> list[str]:
+        asset_paths = []
+        for dirpath, dirnames, filenames in os.walk(asset_root):
+            # Ignore __pycache__ directories
+            if dirpath.endswith("__pycache__"):
+                continue
 
-        assets = {}
-        for dirpath, dirnames, filenames in os.walk("assets/"):
             for filename in filenames:
                 # Ignore configuration files
                 if filename.endswith(".rconfig"):
                     continue
 
-                with open(os.path.join(dirpath, filename), "rb") as f:
-                    # Ignore __pycache__ directories
-                    if dirpath.endswith("__pycache__"):
-                        continue
+                asset_paths.append(os.path.join(dirpath, filename))
 
-                    data = f.read()
+        return sorted(asset_paths)
 
-                    assets[os.path.join(dirpath, filename)] = data
+    @staticmethod
+    def _pack_index_for(asset_name: str) -> int:
+        # Only GhostEngine files go in pak_0.rpk, everything else in pak_1.rpk
+        return 0 if "GhostEngine" in asset_name else 1
 
-        # Keep track of offsets for TOC
-        toc_entries = []
+    @staticmethod
+    def _encode_assets(asset_paths: list[str], workers: int = None):
+        """
+            Reads, hashes and compresses assets on a thread pool, yielding (path, record, stored_data) in the order given. \n
+            At most two jobs per worker are in flight, so memory is bounded by the pool depth rather than the asset total.
+        """
+        workers = workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for asset_path in asset_paths:
+                pending.append((asset_path, pool.submit(_read_and_encode, asset_path)))
 
-        def write_file(asset_name: str, asset_data: str):
-            # Record current offset for this asset
-            toc_entries.append(
-                {
-                    "name": os.path.join(*asset_name.split("\\")).encode("utf-8"),
-                    "offset": pak_file.tell(),
-                    "file": pak_file.name.encode("utf-8")
-                }
-            )
+                if len(pending) >= workers * 2:
+                    asset_path, job = pending.popleft()
+                    yield asset_path, *job.result()
+
+            while pending:
+                asset_path, job = pending.popleft()
+                yield asset_path, *job.result()
 
-            # Write: [name_length (H)][name bytes][data_length (I)][data bytes]
-            name_bytes = asset_name.encode("utf-8")
-            pak_file.write(struct.pack("<H", len(name_bytes)))  # 2 bytes for name length
-            pak_file.write(name_bytes)                           # variable-length name
-            pak_file.write(struct.pack("<I", len(asset_data)))   # 4 bytes for data length
-            pak_file.write(asset_data)                           # actual asset data
-
-        with open("pak_0.rpk", "wb+") as pak_file:
-            # --- Write header ---
-            # Magic(4s) + version(H) + asset_count(H)
-            header_struct = struct.Struct("<4sHH")
-            magic = b"RPK0"
-            version = 1
-            asset_count = len(assets)
-            pak_file.write(header_struct.pack(magic, version, asset_count))
-
-            # --- Write engine asset blocks ---
-            for asset_name, asset_data in assets.copy().items():
-                if "GhostEngine" not in asset_name:
-                    # Only pack GhostEngine files in pak_0.rpk
+    @staticmethod
+    def _write_blob(pak_file: io.BufferedWriter, stored_data: bytes) -> int:
+        """
+            Writes a blob at the end of an open pack, padded so it starts aligned. Returns its offset.
+        """
+        pak_file.seek(0, io.SEEK_END)
+        pak_file.write(b"\0" * (-pak_file.tell() % _ALIGNMENT))
+
+        offset = pak_file.tell()
+        pak_file.write(stored_data)
+        return offset
+
+    @staticmethod
+    def _full_build(workers: int = None) -> dict:
+        manifest = {"version": MANIFEST_VERSION, "packs": {}, "assets": {}}
+        stats = {"written": 0, "reused": 0, "removed": 0, "deduplicated": 0}
+
+        # Content hash -> record of the first asset stored with it, identical assets then share that blob
+        blobs: dict[str, dict] = {}
+
+        asset_paths = Pack._walk_assets()
+        for pack_index, pack_name in enumerate(PACK_NAMES):
+            pack_assets = [path for path in asset_paths if Pack._pack_index_for(path) == pack_index]
+
+            with open(pack_name, "wb+", buffering=_WRITE_BUFFER) as pak_file:
+                pak_file.write(_PACK_HEADER.pack(b"RPK0", PACK_VERSION, 0, 0))
+
+                for asset_path, record, stored_data in Pack._encode_assets(pack_assets, workers):
+                    manifest["assets"][_normalize_name(asset_path)] = Pack._store_record(pak_file, pack_index, record, stored_data, blobs, stats)
+
+                if pack_index == len(PACK_NAMES) - 1:
+                    Pack._store_build_id(pak_file, pack_index, manifest)
+
+                manifest["packs"][pack_name] = {"size": pak_file.tell(), "garbage": 0}
+
+        Pack._finish_packs(manifest)
+        Pack._write_master_from_manifest(manifest)
+        return stats
+
+    @staticmethod
+    def _store_record(pak_file: io.BufferedWriter, pack_index: int, record: dict, stored_data: bytes, blobs: dict[str, dict], stats: dict) -> dict:
+        """
+            Points the record at an already stored blob with the same content, or writes the data as a new blob.
+        """
+        shared = blobs.get(_blob_key(record))
+        if shared is not None:
+            record.update({key: shared[key] for key in ("pack", "offset", "stored_size", "flags")})
+            stats["deduplicated"] += 1
+            return record
+
+        record.update({"pack": pack_index, "offset": Pack._write_blob(pak_file, stored_data)})
+        blobs[_blob_key(record)] = record
+        stats["written"] += 1
+        return record
+
+    @staticmethod
+    def _store_build_id(pak_file: io.BufferedWriter, pack_index: int, manifest: dict):
+        """
+            Writes the build id of manifest's assets as a blob, recorded under manifest["build"]. Layers check it before mounting.
+        """
+        build_id = _build_id(manifest["assets"])
+        manifest["build"] = {
+            "id": build_id, "pack": pack_index, "offset": Pack._write_blob(pak_file, build_id.encode("ascii")),
+            "stored_size": len(build_id), "flags": CODEC_NONE
+        }
+
+    @staticmethod
+    def _finish_packs(manifest: dict):
+        """
+            Writes each pack's blob count into its header and records how much of it no asset points at anymore.
+        """
+        for pack_index, pack_name in enumerate(PACK_NAMES):
+            # Deduplicated assets share a blob, so count each location once
+            live_blobs = {
+                (record["offset"], record["stored_size"])
+                for record in [*manifest["assets"].values(), manifest["build"]] if record["pack"] == pack_index
+            }
+
+            pack_info = manifest["packs"][pack_name]
+            pack_info["garbage"] = pack_info["size"] - _PACK_HEADER.size - sum(size for _, size in live_blobs)
+
+            with open(pack_name, "r+b") as pak_file:
+                pak_file.write(_PACK_HEADER.pack(b"RPK0", PACK_VERSION, 0, len(live_blobs)))
+
+    @staticmethod
+    def _incremental_build(manifest: dict, workers: int = None) -> dict:
+        stats = {"written": 0, "reused": 0, "removed": 0, "deduplicated": 0}
+        old_assets: dict[str, dict] = manifest["assets"]
+        new_assets: dict[str, dict] = {}
+
+        # Every blob still in the packs can be shared, even if the asset that wrote it has since changed
+        blobs = {_blob_key(record): record for record in old_assets.values()}
+
+        # Same size, timestamp and cook fingerprint, trust the manifest without reading the file
+        changed = []
+        for asset_path in Pack._walk_assets():
+            name = _normalize_name(asset_path)
+            record = old_assets.pop(name, None)
+            stat = os.stat(asset_path)
+
+            if (record and record["size"] == stat.st_size and record["mtime"] == stat.st_mtime_ns
+                    and record.get("cook") == _cook_fingerprint(asset_path)):
+                new_assets[name] = record
+                stats["reused"] += 1
+            else:
+                changed.append((asset_path, record))
+
+        # Anything left in the old manifest was deleted from assets/
+        stats["removed"] = len(old_assets)
+
+        old_records = dict(changed)
+        pack_files = [open(pack_name, "r+b", buffering=_WRITE_BUFFER) for pack_name in PACK_NAMES]
+        try:
+            for asset_path, record, stored_data in Pack._encode_assets([path for path, _ in changed], workers):
+                name = _normalize_name(asset_path)
+                old_record = old_records[asset_path]
+
+                # Touched but identical and cooked the same way, keep the stored copy
+                if old_record and old_record["hash"] == record["hash"] and old_record.get("cook") == record.get("cook"):
+                    old_record["mtime"] = record["mtime"]
+                    new_assets[name] = old_record
+                    stats["reused"] += 1
                     continue
 
-                write_file(asset_name, asset_data)
-
-                assets.pop(asset_name)
-
-        with open("pak_1.rpk", "wb+") as pak_file:
-            # --- Write header ---
-            # Magic(4s) + version(H) + asset_count(H)
-            header_struct = struct.Struct("<4sHH")
-            magic = b"RPK0"
-            version = 1
-            asset_count = len(assets)
-            pak_file.write(header_struct.pack(magic, version, asset_count))
-
-            # --- Write engine asset blocks ---
-            for asset_name, asset_data in assets.items():
-                write_file(asset_name, asset_data)
-
-        # --- Write the master pak, which contains the TOC ---
-        with open("pak_master.mrpk", "wb+") as master_pak:
-            # Magic (4s), version (H), entry count (H)
-            header_struct = struct.Struct("<4sHH")
-            magic = b"RPKM"
-            version = 1
-            master_pak.write(header_struct.pack(magic, version, len(toc_entries)))
-
-            byte_content = b""
-
-            # Each entry in the TOC (length of entry name (H), entry name, length of pack name (H), pack name, and offset (I))
-            for entry in toc_entries:
-                byte_content += struct.pack("<H", len(entry["name"]))
-                byte_content += entry["name"].replace(b"/", b"\\")
-                byte_content += struct.pack("<H", len(entry["file"]))
-                byte_content += entry["file"]
-                byte_content += struct.pack("<I", entry["offset"])
-
-            packs_offset = header_struct.size + 2 + len(byte_content)
-            master_pak.write(struct.pack("<H", packs_offset))
-
-            master_pak.write(byte_content)
\ No newline at end of file
+                pack_index = Pack._pack_index_for(asset_path)
+                new_assets[name] = Pack._store_record(pack_files[pack_index], pack_index, record, stored_data, blobs, stats)
+
+            # The old build id is left behind as garbage like any other replaced blob
+            manifest["assets"] = dict(sorted(new_assets.items()))
+            Pack._store_build_id(pack_files[-1], len(PACK_NAMES) - 1, manifest)
+
+            for pack_index, pak_file in enumerate(pack_files):
+                manifest["packs"][PACK_NAMES[pack_index]]["size"] = pak_file.seek(0, io.SEEK_END)
+
+        finally:
+            for pak_file in pack_files:
+                pak_file.close()
+
+        Pack._finish_packs(manifest)
+        Pack._write_master_from_manifest(manifest)
+        return stats
+
+    @staticmethod
+    def _load_manifest() -> dict | None:
+        """
+            Returns the last build's manifest, or None when it can't be used for an incremental build.
+        """
+        if not os.path.isfile(MANIFEST_PATH) or not all(os.path.isfile(pack_name) for pack_name in PACK_NAMES):
+            return None
+
+        try:
+            with open(MANIFEST_PATH) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            Logger("BUILD").log_warning("Build manifest is unreadable, doing a full rebuild.")
+            return None
+
+        if manifest.get("version") != MANIFEST_VERSION or list(manifest.get("packs", {}).keys()) != list(PACK_NAMES):
+            return None
+
+        for pack_name, pack_info in manifest["packs"].items():
+            if os.path.getsize(pack_name) != pack_info["size"]:
+                Logger("BUILD").log_warning(f"{pack_name} doesn't match the build manifest, doing a full rebuild.")
+                return None
+
+        return manifest
+
+    @staticmethod
+    def _write_master_from_manifest(manifest: dict):
+        toc_entries = [
+            {
+                "name": record.get("entry", name).encode("utf-8"),
+                "pack": record["pack"],
+                "offset": record["offset"],
+                "size": record["stored_size"],
+                "flags": record["flags"]
+            }
+            for name, record in [*manifest["assets"].items(), (BUILD_ID_ENTRY, manifest["build"])]
+        ]
+
+        Pack._write_master(Pack.BASE_MASTER, list(PACK_NAMES), toc_entries)
+
+        with open(MANIFEST_PATH, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+
+    @staticmethod
+    def _write_master(path: str, pack_names: list[str], toc_entries: list[dict]):
+        """
+            Writes a v2 master: the pack table, a hash index sized to stay at most half full, and the names blob.
+        """
+        pack_table = b"".join(
+            struct.pack("<H", len(name.encode("utf-8"))) + name.encode("utf-8") for name in pack_names
+        )
+
+        slot_count = 1
+        while slot_count < len(toc_entries) * 2 + 1:
+            slot_count *= 2
+
+        slots_offset = _MASTER_HEADER.size + len(pack_table)
+        slots_offset += -slots_offset % 8
+
+        slots = bytearray(_SLOT.pack(0, 0, 0, 0, 0, _EMPTY_SLOT, 0, 0) * slot_count)
+        names = bytearray()
+        mask = slot_count - 1
+        for entry in toc_entries:
+            name_hash = _hash_name(entry["name"])
+            index = name_hash & mask
+            while _SLOT.unpack_from(slots, index * _SLOT.size)[5] != _EMPTY_SLOT:
+                index = (index + 1) & mask
+
+            _SLOT.pack_into(
+                slots, index * _SLOT.size,
+                name_hash, entry["offset"], entry["size"],
+                len(names), len(entry["name"]), entry["pack"], entry.get("flags", 0), 0
+            )
+            names += entry["name"]
+
+        names_offset = slots_offset + len(slots)
+
+        with open(path, "wb+") as master_pak:
+            master_pak.write(_MASTER_HEADER.pack(
+                b"RPKM", MASTER_VERSION, len(pack_names), len(toc_entries), slot_count, slots_offset, names_offset
+            ))
+            master_pak.write(pack_table)
+            master_pak.write(b"\0" * (slots_offset - _MASTER_HEADER.size - len(pack_table)))
+            master_pak.write(slots)
+            master_pak.write(names)
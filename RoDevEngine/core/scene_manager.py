@@ -1,9 +1,14 @@
 from ..rendering.shader_program import ShaderProgram
 from ..scripts.camera import Camera
 from ..rendering.material import Material
+from ..rendering.gpu_resources import GPUResources
+from ..rendering.render_queue import RenderQueue
+from ..rendering.mesh_data import COOKED_MESH_SUFFIX
+from ..rendering.texture_data import load_baked_texture, BAKED_TEXTURE_SUFFIX
 from ..scripts.behavior import Behavior, EditorField
 from .transform import Transform
 from ..scripts.light import Pointlight, Spotlight
+from ..scripts.mesh import Mesh, StaticBatch
 from .packer import Pack
 from ..object import Object 
 from .input import Input, KeyCodes
@@ -15,8 +20,9 @@ from PIL import Image as image
 from RoDevEngine.core.logger import Logger
 
 from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-import os, json, importlib, glfw, sys
+import os, json, importlib, glfw, sys, multiprocessing
 import numpy as np
 import inspect
 
@@ -39,6 +45,13 @@ class SceneManager:
     _instance = None
     _created = False
 
+    # Workers used to parse meshes and decode textures while loading a scene
+    LOAD_WORKERS = os.cpu_count() or 4
+
+    # Baked textures leave out this many of their largest mip levels when first uploaded,
+    # update_scene adds them afterwards, one material per frame
+    STREAMED_MIPS = 2
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(SceneManager, cls).__new__(cls)
@@ -50,6 +63,9 @@ class SceneManager:
 
         self.materials = {}
         SceneManager._created = True
+
+        self._mesh_pool: ProcessPoolExecutor = None
+        self._texture_pool: ThreadPoolExecutor = None
         
         self.compiled = not os.path.isfile(".rproj") # If there is a .rproj file, then the project has not been built yet.
         if self.compiled:
@@ -93,6 +109,16 @@ class SceneManager:
 
         self.active_camera: Camera = None
 
+        self.static_batches: list[StaticBatch] = []
+
+        # Scenes switched to while the scene updates are loaded once the frame is done, the old objects are still being iterated
+        self._updating = False
+        self._pending_scene: int = None
+
+        # Camera of the frame being drawn, for components that pick what to draw from it
+        self.view_pos = glm.vec3(0)
+        self.projection = glm.mat4(1)
+
         if self.editor:
             self.editor_camera_active = False
 
@@ -216,9 +242,16 @@ class SceneManager:
                                 vertex_src = f.read()
                             with open(fragment_path) as f:
                                 fragment_src = f.read()
+
+                            # Optional, shaders without it are drawn one object at a time
+                            instanced_vertex_src = None
+                            instanced_vertex_path = shader_data.get("InstancedVertexShader", "")
+                            if instanced_vertex_path:
+                                with open(instanced_vertex_path) as f:
+                                    instanced_vertex_src = f.read()
                             
                             if vertex_path and fragment_path:
-                                shaders[name] = ShaderProgram(vertex_src, fragment_src)
+                                shaders[name] = ShaderProgram(vertex_src, fragment_src, instanced_vertex_src)
                                 shaders[name].use()
                             else:
                                 Logger("SCENE MANAGEMENT").log_warning(f"Shader {name} is missing VertexShader or FragmentShader fields.")
@@ -232,8 +265,11 @@ class SceneManager:
                     vertex_path = shader_data.get("VertexShader", "assets\\GhostEngine\\base_shader.vert")
                     fragment_path = shader_data.get("FragmentShader", "assets\\GhostEngine\\base_shader.frag")
                     
+                    instanced_vertex_path = shader_data.get("InstancedVertexShader", "")
+                    instanced_vertex_src = self.pack.get(instanced_vertex_path) if instanced_vertex_path else None
+                    
                     if vertex_path and fragment_path:
-                        shaders[name] = ShaderProgram(self.pack.get(vertex_path), self.pack.get(fragment_path))
+                        shaders[name] = ShaderProgram(self.pack.get(vertex_path), self.pack.get(fragment_path), instanced_vertex_src)
                         shaders[name].use()
                     else:
                         Logger("SCENE MANAGEMENT").log_warning(f"Shader {name} is missing VertexShader or FragmentShader fields.")
@@ -255,6 +291,7 @@ class SceneManager:
                             shader_path = material_data.get("shader_path", "")
                             texture_path = material_data.get("texture_path", None)
                             properties = material_data.get("properties", {})
+                            transparent = material_data.get("transparent", False)
                             
                             shader_name = os.path.basename(shader_path).removesuffix(".rshader")
                             if shader_name in shaders.keys():
@@ -263,12 +300,16 @@ class SceneManager:
                                 Logger("SCENE MANAGEMENT").log_warning(f"Material {name} references unknown shader {shader_name}.")
                                 continue
 
-                            img = None
-                            if texture_path:
+                            # Textures are decoded when a scene first uses the material
+                            def load_texture(texture_path=texture_path):
+                                if not texture_path:
+                                    return None, None, None
+
                                 img = image.open(texture_path)
                                 img = img.transpose(image.FLIP_TOP_BOTTOM)
+                                return img.tobytes(), img.size, None
 
-                            Material(name, shader, img.tobytes() if img else None, img.size if img else None, properties)
+                            Material(name, shader, None, None, properties, texture_loader=load_texture, transparent=transparent)
                                 
         else:
             for file in self.pack.files:
@@ -279,16 +320,27 @@ class SceneManager:
                     shader_path: str = material_data.get("shader_path", "")
                     texture_path: str = material_data.get("texture_path", None)
                     properties: dict[str, dict] = material_data.get("properties", {})
+                    transparent: bool = material_data.get("transparent", False)
                     
                     shader_name = os.path.basename(shader_path).removesuffix(".rshader")
                     shader = shaders.get(shader_name, None)
 
                     if shader:
-                        img = None
-                        if texture_path:
+                        # Textures are read when a scene first uses the material
+                        def load_texture(texture_path=texture_path):
+                            if not texture_path:
+                                return None, None, None
+
+                            # Baked textures already hold every mip level as raw RGBA, so no decoding happens here
+                            if self.pack.has(texture_path + BAKED_TEXTURE_SUFFIX):
+                                baked = load_baked_texture(self.pack.get_view(texture_path + BAKED_TEXTURE_SUFFIX))
+                                return None, (baked.width, baked.height), baked.levels
+
                             img = image.open(self.pack.get_io(texture_path))
-                        
-                        Material(name, shader, img.tobytes() if img else None, img.size if img else None, properties)
+                            return img.tobytes(), img.size, None
+
+                        Material(name, shader, None, None, properties, first_mip=SceneManager.STREAMED_MIPS,
+                                 texture_loader=load_texture, transparent=transparent)
                     else:
                         Logger("CORE").log_warning(f"Material {name} references unknown shader: {shader_name}.") 
 
@@ -302,6 +354,7 @@ class SceneManager:
             parent_t = None if parent is None else parent.transform
             object_transform = Transform(glm.vec3(*obj_data["pos"]), glm.vec3(*obj_data["rot"]), glm.vec3(*obj_data["scale"]), parent_t)
             game_object = Object(object_name, self.materials.get(obj_data["material"], self.materials["base_mat"]), object_transform)
+            game_object.static = obj_data.get("static", False)
             scripts = []
 
             for comp_data in obj_data.get("components", []):
@@ -322,6 +375,8 @@ class SceneManager:
                                 self.active_camera = behavior
                         else:
                             behavior = cls.init_method(*vars_data, game_object)
+                            for var_name, value in comp_data.get("fields", {}).items():
+                                setattr(behavior, var_name, value)
 
                             behavior.enabled = comp_data.get("active", True)
                             scripts.append(behavior)
@@ -351,6 +406,10 @@ class SceneManager:
         self.load_scene_index(scene_index)
 
     def load_scene_index(self, scene_index: int):
+        if self._updating:
+            self._pending_scene = scene_index
+            return
+
         scene_name = list(self.scenes.keys())[scene_index]
         scene_path = self.scenes[scene_name]
 
@@ -363,6 +422,14 @@ class SceneManager:
                 if not self.editor:
                     script.on_scene_unload(scene_info)
 
+        # Drop the old scene's hold on GPU resources, whatever the new scene doesn't pick up again is freed below
+        for obj in self.game_objects:
+            obj.destroy()
+
+        for batch in self.static_batches:
+            batch.release()
+        self.static_batches = []
+
         # Load new scene objects
         if not self.compiled:
             with open(scene_path) as scene_file:
@@ -370,15 +437,136 @@ class SceneManager:
         else:
             scene_data = self.pack.get_as_json_dict(scene_path)
 
+        # Decode everything the scene needs in parallel first, so creating the objects only uploads to the GPU
+        self._decode_scene_assets(scene_data)
         self.game_objects = self._instantiate_scene_objects(scene_data)
         Logger("SCENE MANAGEMENT").log_debug(f"Loaded gameobjects for scene {scene_info.scene_name}|{scene_info.scene_index}")
 
+        # Objects stay editable in the editor, so only games batch their static geometry
+        if not self.editor:
+            self.build_static_batches()
+
+        # Nothing of the old scene is drawn again, start the new one with fresh sort ids
+        RenderQueue().discard()
+
+        freed = GPUResources().collect()
+        if freed:
+            Logger("SCENE MANAGEMENT").log_debug(f"Freed {freed} bytes of GPU resources no longer used after loading {scene_info.scene_name}")
+
         # Call load callbacks
         for obj in self.game_objects:
             for script in obj.components:
                 if not self.editor:
                     script.on_scene_load(scene_info)
 
+        # Warm the next scene's assets while this one runs
+        if self.compiled and scene_index + 1 < len(self.scenes):
+            self.prefetch_scene(scene_index + 1)
+
+    def build_static_batches(self):
+        """
+            Merges the meshes of the scene's static objects into one StaticBatch per material.
+            Static objects with nothing but meshes on them aren't updated at all afterwards.
+        """
+        self.static_batches = StaticBatch.build(self.game_objects)
+
+        for obj in self.game_objects:
+            obj.batched = obj.static and all(isinstance(component, Mesh) and component.batched for component in obj.components)
+
+        if self.static_batches:
+            Logger("SCENE MANAGEMENT").log_debug(
+                f"Built {len(self.static_batches)} static batches from {sum(obj.batched for obj in self.game_objects)} objects"
+            )
+
+    def prefetch_scene(self, scene_index: int):
+        """
+            Starts reading the meshes of a scene on the pack's background threads, so switching to it doesn't hitch.
+            Only does anything when compiled.
+        """
+        if not self.compiled:
+            return
+
+        scene_path = list(self.scenes.values())[scene_index]
+        scene_data = self.pack.get_as_json_dict(scene_path)
+
+        mesh_assets, _, _ = self._collect_scene_assets(scene_data)
+        asset_names = [os.path.join(*file_path.split("."), file_name) for file_path, file_name in mesh_assets]
+
+        # Prefer the cooked mesh, which is what Mesh will load
+        asset_names = [name + COOKED_MESH_SUFFIX if self.pack.has(name + COOKED_MESH_SUFFIX) else name for name in asset_names]
+        self.pack.prefetch([name for name in asset_names if self.pack.has(name)])
+
+    def _collect_scene_assets(self, scene_data: dict) -> tuple[set[tuple[str, str]], set[str], set[tuple[str, str]]]:
+        """
+            Returns the (mesh_path, mesh_name) of every Mesh component, the name of every material in a scene
+            and the (mesh_path, mesh_name) of the Mesh components on static objects.
+        """
+        mesh_assets = set()
+        material_names = set()
+        static_mesh_assets = set()
+        def collect(obj_data: dict):
+            material_names.add(obj_data.get("material"))
+
+            for comp_data in obj_data.get("components", []):
+                vars_data = comp_data.get("vars", {})
+                if comp_data.get("class") == "Mesh" and isinstance(vars_data, list) and len(vars_data) >= 2:
+                    mesh_assets.add((vars_data[0], vars_data[1]))
+                    if obj_data.get("static", False):
+                        static_mesh_assets.add((vars_data[0], vars_data[1]))
+
+            for child in obj_data.get("children", []):
+                collect(child)
+
+        for obj_data in scene_data["objects"]:
+            collect(obj_data)
+
+        return mesh_assets, material_names, static_mesh_assets
+
+    def _get_mesh_pool(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked, a fork would copy the GL context and the window
+        if self._mesh_pool is None:
+            self._mesh_pool = ProcessPoolExecutor(SceneManager.LOAD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return self._mesh_pool
+
+    def _get_texture_pool(self) -> ThreadPoolExecutor:
+        # PIL releases the GIL while decoding, so threads are enough for textures
+        if self._texture_pool is None:
+            self._texture_pool = ThreadPoolExecutor(SceneManager.LOAD_WORKERS, thread_name_prefix="TextureDecode")
+        return self._texture_pool
+
+    def _decode_scene_assets(self, scene_data: dict):
+        """
+            CPU phase of a scene load. Meshes are parsed on the process pool and textures decoded on the thread pool,
+            both at once. Nothing here touches GL, the uploads happen afterwards on the main thread as objects get created.
+        """
+        mesh_assets, material_names, static_mesh_assets = self._collect_scene_assets(scene_data)
+        # Objects with an unknown material fall back to base_mat
+        material_names.add("base_mat")
+
+        texture_jobs = {
+            name: self._get_texture_pool().submit(self.materials[name].decode_texture)
+            for name in material_names if name in self.materials and self.materials[name].needs_texture
+        }
+
+        if mesh_assets:
+            Mesh.decode_meshes(mesh_assets, self._get_mesh_pool())
+
+        # Every instance of these shares the CPU data static batching needs, whichever instance gets built first
+        Mesh.static_sources = set() if self.editor else static_mesh_assets
+
+        for name, job in texture_jobs.items():
+            try:
+                job.result()
+            except Exception as e:
+                Logger("SCENE MANAGEMENT").log_warning(f"Failed to decode the texture of material {name}: {e}")
+
+    def memory_report(self) -> dict:
+        """
+            Returns GPU and host memory used by meshes and textures, per kind and in total.
+            See GPUResources.memory_report.
+        """
+        return GPUResources().memory_report()
+
     def get_objects_with_component(self, component_class) -> list[Object]:
         objects = []
         for object in self.game_objects:
@@ -410,6 +598,17 @@ class SceneManager:
 
 
     def update_scene(self):
+        self._updating = True
+        try:
+            self._update_scene()
+        finally:
+            self._updating = False
+
+        if self._pending_scene is not None:
+            scene_index, self._pending_scene = self._pending_scene, None
+            self.load_scene_index(scene_index)
+
+    def _update_scene(self):
         time = glfw.get_time()
         dt = time - self.last_time
         self.last_time = time
@@ -461,21 +660,46 @@ class SceneManager:
             spotlights.append(light)
         
         for shader in self.shaders.values():
-            shader.set_point_lights(pointlights)
-            shader.set_spot_lights(spotlights)
+            # Uniforms are per program, so instanced variants need their own copy
+            for program in shader.variants:
+                program.set_point_lights(pointlights)
+                program.set_spot_lights(spotlights)
 
-            shader.set_vec3("uViewPos", view_pos)
+                program.set_vec3("uViewPos", view_pos)
 
-            shader.set_bool("uDisableLighting", self.disable_lighting)
+                program.set_bool("uDisableLighting", self.disable_lighting)
 
+                program.set_mat4("uView", view)
+                program.set_mat4("uProjection", proj)
+
+        self.view_pos = glm.vec3(view_pos)
+        self.projection = proj
+
+        render_queue = RenderQueue()
+        render_queue.begin(view_pos)
+
+        # Meshes only submit to the render queue while updating, nothing is drawn yet
         for obj in self.game_objects:
-            obj.update(dt, view, proj)
+            if not obj.batched:
+                obj.update(dt, view, proj)
+
+        for batch in self.static_batches:
+            batch.submit()
 
         while self.accumulator >= 1/50:
             for obj in self.game_objects:
                 obj.fixed_update()
             self.accumulator -= 1/50
 
+        # Draw everything sorted for the fewest state changes once gameplay is done with the frame
+        render_queue.flush()
+
+        # Fill in the mip levels textures were first uploaded without, a material at a time so no frame uploads them all
+        for material in self.materials.values():
+            if material.has_pending_mips:
+                material.upload_remaining_mips()
+                break
+
         for _, components in Behavior.component_category_registry.items():
             for component in components:
                 component.on_frame_end()
@@ -509,6 +733,7 @@ class SceneManager:
                 "scale": obj.transform.scale.to_list(),
 
                 "material": None,
+                "static": obj.static,
                 "components": [],
 
                 "children": []
@@ -534,8 +759,13 @@ class SceneManager:
                         "class": type(component).__name__,
                         "vars": [
                             *component.init_vars
-                        ]
+                        ],
+                        "fields": {}
                     })
+                    # EditorFields the init method doesn't set, like a mesh's LOD thresholds
+                    for var, field in vars(type(component)).items():
+                        if isinstance(field, EditorField):
+                            base["components"][-1]["fields"][var] = json_serialize(component, var)
 
             if children != {}:
                 for child, children in children.items():
@@ -4,6 +4,7 @@ from typing_extensions import overload
 from .logger import Logger
 from .scene_manager import SceneManager
 from .input import Input
+from ..rendering.render_state import RenderState
 
 from ..editor import editor_windows
 
@@ -57,8 +58,8 @@ class Window:
 
         gl.glClearColor(0.25, 0.25, 1, 1)
 
-        gl.glEnable(gl.GL_CULL_FACE)
-        gl.glEnable(gl.GL_DEPTH_TEST)
+        RenderState().set_enabled(gl.GL_CULL_FACE, True)
+        RenderState().set_enabled(gl.GL_DEPTH_TEST, True)
 
         self.input_handler = Input()
 
@@ -85,6 +86,8 @@ class Window:
         return glfw.window_should_close(self.window)
 
     def update(self):
+        RenderState().begin_frame()
+
         glfw.poll_events()
 
         self.input_handler.get_inputs(self.window)
@@ -98,6 +101,9 @@ class Window:
         if self.editor:
             self.__render_editor_ui()
 
+            # The UI renderer binds its own program, VAO, buffers and texture
+            RenderState().invalidate()
+
         glfw.swap_buffers(self.window)
 
     def open_editor_window(self, window: editor_windows.EditorWindow):
@@ -132,6 +132,11 @@ class Inspector(EditorWindow):
                 self.object.name = value
                 self.object.enabled = val
 
+            # Static objects get merged into static batches when the game loads the scene
+            changed, val = imgui.checkbox("Static", self.object.static)
+            if changed:
+                self.object.static = val
+
             # Transform
             changed, values = imgui.drag_float3("Position:", *self.object.transform.localpos)
             if changed:
@@ -167,6 +172,8 @@ class Inspector(EditorWindow):
                     if comp_popup:
                         component.enabled = imgui.checkbox("Enabled", component.enabled)[1]
                         if imgui.button("Remove", 100):
+                            # Lets go of the component's GPU resources, freed on the next collect
+                            component.on_destroy()
                             self.object.components.remove(component)
 
                 imgui.pop_id()
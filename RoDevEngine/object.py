@@ -24,6 +24,7 @@ class Object:
     def __init__(self, name, material:Material, transform: Transform = Transform(), *components):
         self.name = name
         self.mat = material
+        self.mat.acquire()
         self.components : list[Behavior] = []
 
         transform.gameobject = self
@@ -36,6 +37,11 @@ class Object:
         self.__transform = transform
         self.__enabled = True
 
+        # Static objects never move after load, outside the editor their meshes are merged into static batches
+        self.static = False
+        # Set when nothing of the object is left to update per frame, see SceneManager.build_static_batches
+        self.batched = False
+
         for comp in components:
             if issubclass(type(comp), Behavior):
                 self.components.append(comp)
@@ -48,10 +54,8 @@ class Object:
         return self.__transform
 
     def update(self, dt, view, proj):
+        # uView and uProjection are set once per shader by SceneManager, and meshes bind their material when they draw
         if self.enabled:
-            self.mat.use()
-            self.mat.shader.set_mat4("uView", view)
-            self.mat.shader.set_mat4("uProjection", proj)
             for component in self.components:
                 if not component.enabled:
                     continue
@@ -62,9 +66,21 @@ class Object:
                 component.update(dt)
     
     def set_material(self, mat:Material):
+        mat.acquire()
+        self.mat.release()
+
         self.mat = mat
         return self
 
+    def destroy(self):
+        """
+            Releases the GPU resources the object and its components hold. Called by SceneManager when the object's scene unloads.
+        """
+        for component in self.components:
+            component.on_destroy()
+
+        self.mat.release()
+
     def fixed_update(self):
         for component in self.components:
             if component.enabled:
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Hashable, Optional
+
+from ..core.logger import Logger
+
+@dataclass
+class GPUResource:
+    kind: str
+    gpu_bytes: int
+    host_bytes: int
+    # Deletes the GL objects, None for resources that can't be recreated and so are never freed
+    delete: Optional[Callable[[], None]]
+    refs: int = 0
+
+class GPUResources:
+    """
+        Reference counts for shared GL objects (mesh buffers, textures). \n
+        Releasing the last reference doesn't delete anything yet, resources are only freed by collect(),
+        which SceneManager runs after a scene switch. That way a resource used by both scenes survives the switch.
+    """
+    _instance = None
+    _created = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(GPUResources, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if GPUResources._created:
+            return
+
+        self.resources: dict[Hashable, GPUResource] = {}
+        GPUResources._created = True
+
+    def add(self, key: Hashable, kind: str, gpu_bytes: int, host_bytes: int = 0, delete: Optional[Callable[[], None]] = None) -> GPUResource:
+        """
+            Tracks a new resource with no references. Pass delete=None to keep it for the whole session.
+        """
+        resource = GPUResource(kind, gpu_bytes, host_bytes, delete)
+        self.resources[key] = resource
+        return resource
+
+    def has(self, key: Hashable) -> bool:
+        return key in self.resources
+
+    def acquire(self, key: Hashable):
+        self.resources[key].refs += 1
+
+    def release(self, key: Hashable):
+        resource = self.resources.get(key)
+        if resource is None:
+            return
+
+        if resource.refs <= 0:
+            Logger("CORE").log_warning(f"GPU resource {key} released more often than it was acquired.")
+            return
+
+        resource.refs -= 1
+
+    def collect(self) -> int:
+        """
+            Deletes every resource nothing references anymore. Needs the GL context to be current.
+            Returns the GPU bytes freed.
+        """
+        freed = 0
+        for key, resource in list(self.resources.items()):
+            if resource.refs > 0 or resource.delete is None:
+                continue
+
+            resource.delete()
+            del self.resources[key]
+            freed += resource.gpu_bytes
+
+        return freed
+
+    def memory_report(self) -> dict:
+        """
+            Returns count, references, GPU bytes and host bytes per resource kind, plus a "total" entry.
+            Unreferenced resources waiting for collect() are counted as "unused".
+        """
+        report = {}
+        total = {"count": 0, "unused": 0, "refs": 0, "gpu_bytes": 0, "host_bytes": 0}
+
+        for resource in self.resources.values():
+            kind = report.setdefault(resource.kind, {"count": 0, "unused": 0, "refs": 0, "gpu_bytes": 0, "host_bytes": 0})
+            for stats in (kind, total):
+                stats["count"] += 1
+                stats["unused"] += resource.refs == 0
+                stats["refs"] += resource.refs
+                stats["gpu_bytes"] += resource.gpu_bytes
+                stats["host_bytes"] += resource.host_bytes
+
+        report["total"] = total
+        return report
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from OpenGL import GL
+import ctypes
+
+from .render_state import RenderState
+
+# aModel, the per-instance model matrix, takes this location and the three after it, one per column
+INSTANCE_MATRIX_LOCATION = 3
+
+_MATRIX_BYTES = 64
+
+def can_instance(material) -> bool:
+    """
+        True when the material's shader has an instanced variant (InstancedVertexShader in the .rshader).
+    """
+    return material.shader.instanced is not None
+
+def draw_instanced(shared: dict, models: list[bytes]):
+    """
+        Draws a mesh once per model matrix (column major, as given by glm's to_bytes) with a single glDrawElementsInstanced.
+        The material must already be bound with use(instanced=True). shared is the mesh's buffer entry (vao, count, index_type),
+        it gets an "instance_vbo" added the first time the mesh is drawn instanced.
+    """
+    render_state = RenderState()
+    render_state.bind_vertex_array(shared["vao"])
+    if "instance_vbo" not in shared:
+        shared["instance_vbo"] = _create_instance_buffer()
+
+    # Orphaned and refilled every draw, the driver hands out fresh memory instead of waiting on the last draw
+    data = b"".join(models)
+    render_state.bind_buffer(GL.GL_ARRAY_BUFFER, shared["instance_vbo"])
+    GL.glBufferData(GL.GL_ARRAY_BUFFER, len(data), data, GL.GL_STREAM_DRAW)
+
+    GL.glDrawElementsInstanced(GL.GL_TRIANGLES, shared["count"], shared["index_type"], None, len(models))
+
+def _create_instance_buffer() -> int:
+    # Recorded in the bound VAO, so the attributes only need to be set up once per mesh
+    vbo = GL.glGenBuffers(1)
+    RenderState().bind_buffer(GL.GL_ARRAY_BUFFER, vbo)
+
+    for column in range(4):
+        location = INSTANCE_MATRIX_LOCATION + column
+        GL.glEnableVertexAttribArray(location)
+        GL.glVertexAttribPointer(location, 4, GL.GL_FLOAT, GL.GL_FALSE, _MATRIX_BYTES, ctypes.c_void_p(column * 16))
+        GL.glVertexAttribDivisor(location, 1)
+
+    return vbo
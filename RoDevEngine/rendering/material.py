@@ -1,18 +1,21 @@
 from __future__ import annotations
-from typing import Optional
+from typing import Callable, Optional
 
 import OpenGL.GL as gl
 import PIL.Image as image
+import numpy as np
 
 from ..core.logger import Logger
 from ..rendering.shader_program import ShaderProgram
+from .gpu_resources import GPUResources
+from .render_state import RenderState
 
 class register_mat:
     def __init__(self, cls):
         self.cls = cls
 
     def __call__(self, name, *args, **kwds):
-        mat_cls = self.cls(*args)
+        mat_cls = self.cls(*args, **kwds)
 
         from ..core.scene_manager import SceneManager
         SceneManager().materials[name] = mat_cls
@@ -21,44 +24,159 @@ class register_mat:
 
 @register_mat
 class Material:
-    def __init__(self, shader: ShaderProgram, texture_data: Optional[bytes], texture_size: Optional[tuple[int, int]] = None, properties: Optional[dict] = None):
+    def __init__(self, shader: ShaderProgram, texture_data: Optional[bytes], texture_size: Optional[tuple[int, int]] = None, properties: Optional[dict] = None,
+                 mip_levels: Optional[list[tuple[int, int, memoryview]]] = None, first_mip: int = 0,
+                 texture_loader: Optional[Callable[[], tuple]] = None, transparent: bool = False):
+        """
+            mip_levels: prebuilt (width, height, RGBA8 data) levels, full size first, uploaded as is instead of texture_data. \n
+            first_mip: only upload levels from this one down, call upload_remaining_mips later to add the larger ones. \n
+            texture_loader: returns (texture_data, texture_size, mip_levels). When given, the texture is only created once
+            the material is acquired, and deleted again once nothing uses it. \n
+            transparent: drawn after everything opaque, farthest first and alpha blended.
+        """
         self.shader = shader
+        self.transparent = transparent
         self.properties = properties if properties else {}
 
+        self.texture = None
+        self._first_mip = first_mip
+        self._texture_loader = texture_loader
+        self._decoded_texture: Optional[tuple] = None
+        self._pending_mips: list[tuple[int, int, memoryview]] = []
+
+        if texture_loader is None:
+            # Nothing to recreate the texture from, so it lives for the whole session
+            self._create_texture(texture_data, texture_size, mip_levels, managed=False)
+
+        Logger("CORE").log_debug(f"Material created with shader: {shader}, properties: {self.properties}")
+
+    def _create_texture(self, texture_data: Optional[bytes], texture_size: Optional[tuple[int, int]], mip_levels: Optional[list[tuple[int, int, memoryview]]], managed: bool = True):
         self.texture = gl.glGenTextures(1)
-        if not texture_data:
+
+        if mip_levels:
+            self._upload_mips(mip_levels, min(self._first_mip, len(mip_levels) - 1))
+            gpu_bytes = sum(width * height * 4 for width, height, _ in mip_levels)
+
+        elif not texture_data:
             # Create a default white texture
             white_pixel = [255, 255, 255, 255]
-            gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+            RenderState().bind_texture(self.texture)
             gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, 1, 1, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, bytes(white_pixel))
             gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
             gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-            gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+            gpu_bytes = 4
 
         else:
-            gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+            RenderState().bind_texture(self.texture)
             gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, *texture_size, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, texture_data)
             gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
             gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_REPEAT)
             gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_REPEAT)
             gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR_MIPMAP_LINEAR)
             gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-            gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+            # A full mip chain adds a third on top of the base level
+            gpu_bytes = texture_size[0] * texture_size[1] * 4 * 4 // 3
 
-        Logger("CORE").log_debug(f"Material created with shader: {shader}, properties: {self.properties}")
+        texture = self.texture
+        def delete():
+            gl.glDeleteTextures(1, [texture])
+            RenderState().forget_texture(texture)
+            if self.texture == texture:
+                self.texture = None
+                self._pending_mips = []
+
+        GPUResources().add(self._resource_key, "texture", gpu_bytes, delete=delete if managed else None)
+
+    @property
+    def _resource_key(self):
+        return ("texture", id(self))
+
+    @property
+    def has_pending_mips(self) -> bool:
+        """True when the texture is missing mip levels held back by first_mip."""
+        return bool(self._pending_mips)
+
+    @property
+    def needs_texture(self) -> bool:
+        """True when acquiring the material would have to load its texture."""
+        return self.texture is None and self._texture_loader is not None
+
+    def decode_texture(self):
+        """
+            Runs the texture loader and keeps the result for the next upload. Makes no GL calls,
+            so it can run on a worker thread while the main thread holds the context.
+        """
+        if self.needs_texture and self._decoded_texture is None:
+            self._decoded_texture = self._texture_loader()
+
+    def _load_texture(self):
+        decoded, self._decoded_texture = self._decoded_texture, None
+        self._create_texture(*(decoded or self._texture_loader()))
+
+    def acquire(self):
+        """
+            Marks the material as used, creating its texture if it was never loaded or was freed.
+        """
+        if self.texture is None:
+            self._load_texture()
+        GPUResources().acquire(self._resource_key)
+
+    def release(self):
+        """
+            Drops a use of the material. The texture is deleted on the next GPUResources().collect() if nothing else uses it.
+        """
+        GPUResources().release(self._resource_key)
+
+    def _upload_mips(self, mip_levels: list[tuple[int, int, memoryview]], first_mip: int):
+        RenderState().bind_texture(self.texture)
+        for level in range(first_mip, len(mip_levels)):
+            width, height, data = mip_levels[level]
+            gl.glTexImage2D(gl.GL_TEXTURE_2D, level, gl.GL_RGBA, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, np.frombuffer(data, np.uint8))
+
+        # Sample only the levels that are actually there
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_BASE_LEVEL, first_mip)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAX_LEVEL, len(mip_levels) - 1)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_REPEAT)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_REPEAT)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR_MIPMAP_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+
+        self._pending_mips = mip_levels[:first_mip]
+
+    def upload_remaining_mips(self):
+        """
+            Uploads the larger mip levels skipped by first_mip and lets the texture sample them.
+        """
+        if not self._pending_mips:
+            return
+
+        RenderState().bind_texture(self.texture)
+        for level, (width, height, data) in enumerate(self._pending_mips):
+            gl.glTexImage2D(gl.GL_TEXTURE_2D, level, gl.GL_RGBA, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, np.frombuffer(data, np.uint8))
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_BASE_LEVEL, 0)
+
+        self._pending_mips = []
+
+    def use(self, instanced: bool = False):
+        """
+            Binds the texture and the shader and sets the material's properties.
+            instanced picks the shader's instanced variant.
+        """
+        if self.texture is None:
+            self._load_texture()
 
-    def use(self):
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+        RenderState().bind_texture(self.texture)
         
-        self.shader.use()
+        shader = self.shader.instanced if instanced else self.shader
+        shader.use()
         for property, value in self.properties.items():
             if isinstance(value, dict) and "type" in value and "value" in value:
                 if value["type"] == "vec3":
-                    self.shader.set_vec3(property, tuple(value["value"]))
+                    shader.set_vec3(property, tuple(value["value"]))
                 elif value["type"] == "float":
-                    self.shader.set_float(property, float(value["value"]))
+                    shader.set_float(property, float(value["value"]))
                 elif value["type"] == "vec2":
-                    self.shader.set_vec2(property, tuple(value["value"]))
+                    shader.set_vec2(property, tuple(value["value"]))
 
             else:
                 Logger("CORE").log_warning(f"Property {property} has an invalid format: {value}")
\ No newline at end of file
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+from .mesh_data import SubmeshData, iter_obj, read_blocks, LAYOUT_FLOAT, OBJ_BLOCK_SIZE
+from .mesh_optimizer import optimize_submesh
+from .mesh_lod import generate_lods
+from ..core.logger import Logger
+
+import numpy as np
+import hashlib
+import json
+import os
+
+MESH_CACHE_DIR = os.path.join(".rcache", "meshes")
+
+# Bump whenever parse_obj's, optimize_submesh's or generate_lods' output changes, so stale caches are rebuilt
+MESH_CACHE_VERSION = 4
+
+_META_FILE = "meta.json"
+
+def _entry_dir(source_path: str) -> str:
+    key = os.path.normcase(os.path.abspath(source_path))
+    return os.path.join(MESH_CACHE_DIR, hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest())
+
+def _read_meta(entry_dir: str) -> dict | None:
+    try:
+        with open(os.path.join(entry_dir, _META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get("version") != MESH_CACHE_VERSION:
+        return None
+    return meta
+
+def _write_meta(entry_dir: str, meta: dict):
+    # Written last and swapped in atomically, so a half written entry is never picked up
+    temp_path = os.path.join(entry_dir, _META_FILE + ".tmp")
+    with open(temp_path, "w") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(temp_path, os.path.join(entry_dir, _META_FILE))
+
+def _load_arrays(entry_dir: str, meta: dict) -> list[SubmeshData] | None:
+    try:
+        submeshes = []
+        for submesh in meta["submeshes"]:
+            data = SubmeshData(
+                submesh["name"],
+                np.load(os.path.join(entry_dir, submesh["vertices"]), mmap_mode="r"),
+                np.load(os.path.join(entry_dir, submesh["indices"]), mmap_mode="r"),
+                submesh.get("layout", LAYOUT_FLOAT),
+                lod_level=submesh.get("lod", 0)
+            )
+
+            # LODs follow the submesh they belong to
+            if data.lod_level > 0 and submeshes:
+                submeshes[-1].lods.append(data)
+            else:
+                submeshes.append(data)
+
+        return submeshes
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _store_submesh(entry_dir: str, meta: dict, submesh: SubmeshData):
+    # Files are named after the content hash, older arrays may still be mapped by live meshes
+    for data in [submesh] + submesh.lods:
+        index = len(meta["submeshes"])
+        vertices_file = f"{meta['hash']}_{index}_vertices.npy"
+        indices_file = f"{meta['hash']}_{index}_indices.npy"
+
+        np.save(os.path.join(entry_dir, vertices_file), np.ascontiguousarray(data.vertices))
+        np.save(os.path.join(entry_dir, indices_file), np.ascontiguousarray(data.indices))
+
+        meta["submeshes"].append({"name": data.name, "vertices": vertices_file, "indices": indices_file, "layout": data.layout, "lod": data.lod_level})
+
+def _remove_stale(entry_dir: str, meta: dict):
+    live_files = {_META_FILE} | {submesh[key] for submesh in meta["submeshes"] for key in ("vertices", "indices")}
+    for file in os.listdir(entry_dir):
+        if file not in live_files:
+            try:
+                os.remove(os.path.join(entry_dir, file))
+            except OSError:
+                pass
+
+def _hash_file(source_path: str) -> str:
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(source_path, "rb") as source:
+        for block in read_blocks(source):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+def load_obj(source_path: str) -> list[SubmeshData]:
+    """
+        Loads an .obj through the editor mesh cache. \n
+        An unchanged source (same mtime and size) is served straight from the cached .npy files, memory mapped.
+        A source that was touched but whose content hash still matches keeps its cache, anything else is parsed and recached.
+        Parsing streams the file and writes every submesh out as soon as it's done, so even huge sources never sit in memory whole.
+    """
+    stat = os.stat(source_path)
+    entry_dir = _entry_dir(source_path)
+    meta = _read_meta(entry_dir)
+
+    if meta and meta.get("mtime_ns") == stat.st_mtime_ns and meta.get("size") == stat.st_size:
+        submeshes = _load_arrays(entry_dir, meta)
+        if submeshes is not None:
+            return submeshes
+
+    content_hash = _hash_file(source_path)
+
+    if meta and meta.get("hash") == content_hash:
+        submeshes = _load_arrays(entry_dir, meta)
+        if submeshes is not None:
+            meta["mtime_ns"] = stat.st_mtime_ns
+            meta["size"] = stat.st_size
+            _write_meta(entry_dir, meta)
+            return submeshes
+
+    meta = {
+        "version": MESH_CACHE_VERSION,
+        "source": source_path,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "hash": content_hash,
+        "submeshes": []
+    }
+
+    try:
+        os.makedirs(entry_dir, exist_ok=True)
+    except OSError as e:
+        Logger("CORE").log_warning(f"Couldn't write mesh cache for {source_path}: {e}")
+        entry_dir = None
+
+    submeshes = []
+    with open(source_path, "rb") as source:
+        for submesh in iter_obj(read_blocks(source, OBJ_BLOCK_SIZE)):
+            submesh, stats = optimize_submesh(submesh)
+            Logger("CORE").log_debug(f"Optimized {source_path}:{submesh.name}, {stats.triangles} triangles, ACMR {stats.acmr_before:.3f} -> {stats.acmr_after:.3f}")
+            submesh.lods = generate_lods(submesh)
+
+            if entry_dir is not None:
+                try:
+                    _store_submesh(entry_dir, meta, submesh)
+                    continue
+                except OSError as e:
+                    Logger("CORE").log_warning(f"Couldn't write mesh cache for {source_path}: {e}")
+                    submeshes = _load_arrays(entry_dir, meta) or []
+                    entry_dir = None
+
+            # Without a cache the arrays have to stay in memory
+            submeshes.append(submesh)
+
+    if entry_dir is None:
+        return submeshes
+
+    # Meta is swapped in last, so a half written entry is never picked up
+    try:
+        _write_meta(entry_dir, meta)
+        _remove_stale(entry_dir, meta)
+    except OSError as e:
+        Logger("CORE").log_warning(f"Couldn't write mesh cache for {source_path}: {e}")
+
+    return _load_arrays(entry_dir, meta) or []
+
+def is_cached(source_path: str) -> bool:
+    """
+        True when load_obj can serve the source from the cache without reading it.
+    """
+    stat = os.stat(source_path)
+    meta = _read_meta(_entry_dir(source_path))
+    return bool(meta) and meta.get("mtime_ns") == stat.st_mtime_ns and meta.get("size") == stat.st_size
+
+def cache_obj(source_path: str):
+    """
+        Brings the cache entry of a source up to date without returning the arrays.
+        Meant for worker processes, the main process then maps the result with load_obj.
+    """
+    load_obj(source_path)
@@ -0,0 +1,423 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+import numpy as np
+import struct
+import re
+
+# Interleaved vertex layout: position (3), normal (3), uv (2)
+VERTEX_FLOATS = 8
+
+# Vertex layouts a submesh can be stored and uploaded in
+LAYOUT_FLOAT = 0      # (vertex_count, VERTEX_FLOATS) float32, 32 bytes per vertex
+LAYOUT_COMPACT = 1    # float32 position, GL_INT_2_10_10_10_REV normal, half float uv, 20 bytes per vertex
+
+COMPACT_VERTEX_DTYPE = np.dtype([("position", "<f4", 3), ("normal", "<u4"), ("uv", "<f2", 2)])
+
+# Bytes read at a time when streaming an .obj, the text held at once never grows much past this
+OBJ_BLOCK_SIZE = 1 << 24
+
+COOKED_MESH_SUFFIX = ".rmesh"
+COOKED_MESH_VERSION = 3
+
+# Header: magic (4s), version (H), submesh count (H)
+_COOKED_HEADER = struct.Struct("<4sHH")
+# Submesh: name offset (I), name length (H), index size (H), vertex count (I), index count (I),
+# bounds min/max (6f), vertex data offset (Q), index data offset (Q), vertex layout (H), LOD level (H).
+# LOD levels above 0 belong to the closest level 0 submesh before them. Levels can have gaps, see SubmeshData.lod_level.
+_COOKED_SUBMESH = struct.Struct("<IHHII6fQQHH")
+
+# Buffers start on this boundary so they can be viewed in place with np.frombuffer
+_ALIGNMENT = 16
+
+@dataclass
+class SubmeshData:
+    name: str
+    vertices: np.ndarray    # LAYOUT_FLOAT: float32, shape (vertex_count, VERTEX_FLOATS). LAYOUT_COMPACT: COMPACT_VERTEX_DTYPE, flat
+    indices: np.ndarray     # uint16 or uint32, flat
+    layout: int = LAYOUT_FLOAT
+    # Simplified versions of this submesh, LOD 1 first
+    lods: list[SubmeshData] = field(default_factory=list)
+    # The LOD this level is drawn at, 0 for full detail. Levels that couldn't be generated are left out,
+    # so a submesh's lods may start at 2 or skip one; the closer levels stand in for the missing ones
+    lod_level: int = 0
+
+    @property
+    def positions(self) -> np.ndarray:
+        if self.layout == LAYOUT_COMPACT:
+            return self.vertices["position"]
+        return self.vertices[:, :3]
+
+    @property
+    def bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        if len(self.vertices) == 0:
+            return np.zeros(3, np.float32), np.zeros(3, np.float32)
+
+        positions = self.positions
+        return positions.min(axis=0), positions.max(axis=0)
+
+    def compacted(self) -> SubmeshData:
+        """
+            Returns this submesh in LAYOUT_COMPACT, 16-bit indices included when the vertex count allows it.
+        """
+        if self.layout == LAYOUT_COMPACT:
+            return self
+
+        return SubmeshData(
+            self.name, compact_vertices(self.vertices), self.indices.astype(_index_dtype(len(self.vertices)), copy=False), LAYOUT_COMPACT,
+            [lod.compacted() for lod in self.lods], self.lod_level
+        )
+
+def pack_normals(normals: np.ndarray) -> np.ndarray:
+    """
+        Packs unit normals into signed normalized 10:10:10:2 integers, as read by GL_INT_2_10_10_10_REV.
+    """
+    quantized = np.rint(np.clip(normals, -1.0, 1.0) * 511.0).astype(np.int32) & 0x3FF
+    return (quantized[:, 0] | (quantized[:, 1] << 10) | (quantized[:, 2] << 20)).astype(np.uint32)
+
+def compact_vertices(vertices: np.ndarray) -> np.ndarray:
+    """
+        Converts LAYOUT_FLOAT vertices to LAYOUT_COMPACT.
+    """
+    compact = np.empty(len(vertices), dtype=COMPACT_VERTEX_DTYPE)
+    compact["position"] = vertices[:, 0:3]
+    compact["normal"] = pack_normals(vertices[:, 3:6])
+    compact["uv"] = vertices[:, 6:8]
+    return compact
+
+def unpack_normals(packed: np.ndarray) -> np.ndarray:
+    """
+        Inverse of pack_normals.
+    """
+    packed = packed.astype(np.int32)
+    fields = np.stack((packed & 0x3FF, (packed >> 10) & 0x3FF, (packed >> 20) & 0x3FF), axis=1)
+    fields[fields >= 512] -= 1024
+    return np.maximum(fields / 511.0, -1.0).astype(np.float32)
+
+def expand_vertices(vertices: np.ndarray) -> np.ndarray:
+    """
+        Converts LAYOUT_COMPACT vertices back to LAYOUT_FLOAT.
+    """
+    expanded = np.empty((len(vertices), VERTEX_FLOATS), dtype=np.float32)
+    expanded[:, 0:3] = vertices["position"]
+    expanded[:, 3:6] = unpack_normals(vertices["normal"])
+    expanded[:, 6:8] = vertices["uv"]
+    return expanded
+
+# Records are matched on the newline in front of them rather than `^`, which lets the regex engine
+# jump between candidate lines instead of trying every character
+_OBJECT_PATTERN = re.compile(r"\no[ \t]+([^\r\n]*)")
+_POSITION_PATTERN = re.compile(r"\nv[ \t]+(\S+[ \t]+\S+[ \t]+\S+)")
+_NORMAL_PATTERN = re.compile(r"\nvn[ \t]+(\S+[ \t]+\S+[ \t]+\S+)")
+_TEX_COORD_PATTERN = re.compile(r"\nvt[ \t]+(\S+[ \t]+\S+)")
+_FACE_PATTERN = re.compile(r"\nf[ \t]+([^\r\n]*)")
+
+def _index_dtype(vertex_count: int):
+    return np.uint16 if vertex_count < 65536 else np.uint32
+
+def _parse_floats(pattern: re.Pattern, text: str, width: int) -> np.ndarray:
+    values = pattern.findall(text)
+    if not values:
+        return np.zeros((0, width), dtype=np.float32)
+
+    return np.fromstring(" ".join(values), dtype=np.float32, sep=" ").reshape(-1, width)
+
+def _parse_faces(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Returns every face corner as (v, vt, vn) with 0 for a missing index, and the corner count of each face.
+    """
+    faces = _FACE_PATTERN.findall(text)
+    if not faces:
+        return np.zeros((0, 3), dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    face_text = "\n".join(faces)
+
+    # A corner starts wherever a non blank character follows a blank one
+    chars = np.frombuffer(face_text.encode("utf-8"), dtype=np.uint8)
+    blank = (chars == 0x20) | (chars == 0x09) | (chars == 0x0A) | (chars == 0x0D)
+    starts = np.flatnonzero(~blank & np.concatenate(([True], blank[:-1])))
+    counts = np.bincount(np.searchsorted(np.flatnonzero(chars == 0x0A), starts), minlength=len(faces))
+
+    # Every corner must share the layout of the first one (v, v/vt, v//vn or v/vt/vn) to be read in bulk
+    fields = faces[0].split(maxsplit=1)[0].count("/") + 1
+    slashes = np.bincount(np.searchsorted(starts, np.flatnonzero(chars == 0x2F), side="right") - 1, minlength=len(starts))
+
+    if fields <= 3 and np.all(slashes == fields - 1):
+        values = np.fromstring(face_text.replace("//", "/0/").replace("/", " "), dtype=np.int64, sep=" ")
+        corners = np.zeros((len(values) // fields, 3), dtype=np.int64)
+        corners[:, :fields] = values.reshape(-1, fields)
+    else:
+        # Corners don't all share the same layout, parse them one by one
+        corners = np.array([
+            [int(part) if part else 0 for part in (corner.split("/") + ["", ""])[:3]]
+            for face in faces for corner in face.split()
+        ], dtype=np.int64).reshape(-1, 3)
+
+    return corners, counts
+
+def _fan_triangulate(counts: np.ndarray) -> np.ndarray:
+    """
+        Returns the corner indices of the triangles (0, i, i + 1) fanned out of each face.
+    """
+    triangle_counts = np.maximum(counts - 2, 0)
+    first_corner = np.cumsum(counts) - counts
+
+    face = np.repeat(np.arange(len(counts)), triangle_counts)
+    step = np.arange(len(face)) - np.repeat(np.cumsum(triangle_counts) - triangle_counts, triangle_counts) + 1
+
+    base = first_corner[face]
+    return np.stack((base, base + step, base + step + 1), axis=1).ravel()
+
+def _build_submesh(name: str, positions: np.ndarray, normals: np.ndarray, tex_coords: np.ndarray, corners: np.ndarray) -> SubmeshData:
+    """
+        De-duplicates (v, vt, vn) corners into an indexed, interleaved vertex buffer. Corners are
+        0 based here with -1 marking a missing vt or vn.
+    """
+    if len(corners) == 0:
+        return SubmeshData(name, np.zeros((0, VERTEX_FLOATS), dtype=np.float32), np.zeros(0, dtype=np.uint16))
+
+    v, vt, vn = corners.T
+    keys = (v * (len(tex_coords) + 1) + (vt + 1)) * (len(normals) + 1) + (vn + 1)
+
+    # Number vertices in order of first use, the same order a dict of corners would give
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    unique = corners[first[order]]
+    vertices = np.zeros((len(unique), VERTEX_FLOATS), dtype=np.float32)
+    vertices[:, 0:3] = positions[unique[:, 0]]
+
+    has_normal = unique[:, 2] >= 0
+    vertices[has_normal, 3:6] = normals[unique[has_normal, 2]]
+
+    has_tex_coord = unique[:, 1] >= 0
+    vertices[has_tex_coord, 6:8] = tex_coords[unique[has_tex_coord, 1]]
+
+    return SubmeshData(name, vertices, rank[inverse.ravel()].astype(_index_dtype(len(vertices))))
+
+class _ObjReader:
+    """
+        Incremental OBJ parser. Text is fed in pieces that end on a line break, each piece is converted to arrays
+        straight away, and a submesh is built as soon as the next `o` line shows its group is complete.
+        Only the arrays of the group being read are held.
+    """
+    def __init__(self):
+        self.name = None
+        self.positions = []
+        self.normals = []
+        self.tex_coords = []
+        self.corners = []
+        self.counts = []
+
+        self.pos_offset = 0
+        self.nor_offset = 0
+        self.tex_offset = 0
+
+    def feed(self, text: str) -> list[SubmeshData]:
+        """
+            Parses whole lines of OBJ text, returning the submeshes of the groups it completes.
+        """
+        text = "\n" + text
+        finished = []
+
+        start = 0
+        for match in _OBJECT_PATTERN.finditer(text):
+            self._parse(text[start:match.start()])
+            finished.extend(self._flush())
+            self.name = match.group(1).strip()
+            start = match.end()
+        self._parse(text[start:])
+
+        return finished
+
+    def finish(self) -> list[SubmeshData]:
+        return self._flush()
+
+    def _parse(self, chunk: str):
+        if not chunk.strip():
+            return
+
+        self.positions.append(_parse_floats(_POSITION_PATTERN, chunk, 3))
+        self.normals.append(_parse_floats(_NORMAL_PATTERN, chunk, 3))
+        self.tex_coords.append(_parse_floats(_TEX_COORD_PATTERN, chunk, 2))
+
+        corners, counts = _parse_faces(chunk)
+        self.corners.append(corners)
+        self.counts.append(counts)
+
+    def _flush(self) -> list[SubmeshData]:
+        positions = np.concatenate(self.positions) if self.positions else np.zeros((0, 3), dtype=np.float32)
+        normals = np.concatenate(self.normals) if self.normals else np.zeros((0, 3), dtype=np.float32)
+        tex_coords = np.concatenate(self.tex_coords) if self.tex_coords else np.zeros((0, 2), dtype=np.float32)
+        corners = np.concatenate(self.corners) if self.corners else np.zeros((0, 3), dtype=np.int64)
+        counts = np.concatenate(self.counts) if self.counts else np.zeros(0, dtype=np.int64)
+
+        submeshes = []
+        if self.name is not None or len(counts):
+            # OBJ indices are global to the file, so offset by everything declared in earlier groups
+            corners = corners[_fan_triangulate(counts)] - (1 + self.pos_offset, 1 + self.tex_offset, 1 + self.nor_offset)
+            corners[:, 1:][corners[:, 1:] < 0] = -1
+
+            submeshes.append(_build_submesh(self.name or "", positions, normals, tex_coords, corners))
+
+        self.pos_offset += len(positions)
+        self.nor_offset += len(normals)
+        self.tex_offset += len(tex_coords)
+
+        self.positions, self.normals, self.tex_coords, self.corners, self.counts = [], [], [], [], []
+        return submeshes
+
+def parse_obj(text: str) -> list[SubmeshData]:
+    """
+        Parses OBJ text into one SubmeshData per `o` group. Faces are fan triangulated and
+        (v, vt, vn) corners de-duplicated into an indexed, interleaved vertex buffer. \n
+        Each record type is pulled out of the whole text at once and converted with NumPy, nothing runs per line in Python.
+    """
+    reader = _ObjReader()
+    return reader.feed(text) + reader.finish()
+
+def read_blocks(source, block_size: int = OBJ_BLOCK_SIZE) -> Iterator[memoryview]:
+    """
+        Yields a binary file, or any buffer such as a memoryview of a mapped pack, block_size bytes at a time.
+    """
+    if hasattr(source, "read"):
+        while block := source.read(block_size):
+            yield memoryview(block)
+        return
+
+    view = memoryview(source)
+    for start in range(0, len(view), block_size):
+        yield view[start:start + block_size]
+
+def iter_obj(blocks: Iterable[bytes]) -> Iterator[SubmeshData]:
+    """
+        Streaming parse_obj: reads OBJ data block by block (see read_blocks) and yields every
+        submesh as soon as its `o` group is complete. \n
+        Peak memory stays around one block plus the largest submesh, however big the file is, so callers can
+        upload or store each submesh and drop it before the next one is read.
+    """
+    reader = _ObjReader()
+    pending = b""
+
+    for block in blocks:
+        data = pending + bytes(block)
+
+        # Only whole lines are parsed, the rest waits for the next block
+        cut = data.rfind(b"\n") + 1
+        pending = data[cut:]
+        if cut:
+            yield from reader.feed(data[:cut].decode("utf-8"))
+
+    yield from reader.feed(pending.decode("utf-8"))
+    yield from reader.finish()
+
+def cook_mesh(submeshes: list[SubmeshData]) -> bytes:
+    """
+        Serializes submeshes into the cooked mesh format: a header, a submesh table, the submesh names,
+        then every vertex and index buffer aligned so it can be viewed in place.
+    """
+    # LODs are written straight after the submesh they belong to
+    levels = [(lod.lod_level, lod) for submesh in submeshes for lod in [submesh] + submesh.lods]
+
+    names = [submesh.name.encode("utf-8") for _, submesh in levels]
+    names_blob = b"".join(names)
+
+    table_size = _COOKED_HEADER.size + _COOKED_SUBMESH.size * len(levels)
+    data_offset = table_size + len(names_blob)
+
+    table = bytearray(_COOKED_HEADER.pack(b"RMSH", COOKED_MESH_VERSION, len(levels)))
+    buffers = []
+    name_offset = 0
+    for (level, submesh), name in zip(levels, names):
+        vertices = np.ascontiguousarray(submesh.vertices)
+        indices = np.ascontiguousarray(submesh.indices)
+        bounds_min, bounds_max = submesh.bounds
+
+        data_offset += -data_offset % _ALIGNMENT
+        vertex_offset = data_offset
+        data_offset += vertices.nbytes
+
+        data_offset += -data_offset % _ALIGNMENT
+        index_offset = data_offset
+        data_offset += indices.nbytes
+
+        table += _COOKED_SUBMESH.pack(
+            name_offset, len(name), indices.itemsize, len(vertices), len(indices),
+            *bounds_min, *bounds_max, vertex_offset, index_offset, submesh.layout, level
+        )
+        buffers.append((vertex_offset, vertices))
+        buffers.append((index_offset, indices))
+        name_offset += len(name)
+
+    out = bytearray(data_offset)
+    out[:table_size] = table
+    out[table_size:table_size + len(names_blob)] = names_blob
+    for offset, array in buffers:
+        out[offset:offset + array.nbytes] = array.tobytes()
+
+    return bytes(out)
+
+def cook_obj(data: bytes, compact: bool = False, optimize: bool = True, overdraw: bool = False, lods: bool = True, stats: list = None) -> bytes:
+    """
+        Build step for .obj assets, parses the text once and returns the cooked mesh. \n
+        optimize reorders triangles and vertices for the GPU's vertex caches (overdraw also sorts triangle clusters),
+        appending an OptimizeStats per submesh to stats when given. lods adds simplified levels to large submeshes.
+        With compact, the submeshes are stored in LAYOUT_COMPACT.
+    """
+    submeshes = parse_obj(data.decode("utf-8"))
+    if optimize:
+        from .mesh_optimizer import optimize_submesh
+
+        optimized = [optimize_submesh(submesh, overdraw) for submesh in submeshes]
+        submeshes = [submesh for submesh, _ in optimized]
+        if stats is not None:
+            stats.extend(submesh_stats for _, submesh_stats in optimized)
+
+    if lods:
+        from .mesh_lod import generate_lods
+
+        for submesh in submeshes:
+            submesh.lods = generate_lods(submesh)
+
+    if compact:
+        submeshes = [submesh.compacted() for submesh in submeshes]
+
+    return cook_mesh(submeshes)
+
+def load_cooked_mesh(buffer) -> list[SubmeshData]:
+    """
+        Reads a cooked mesh. The arrays are views into the buffer, so passing a memoryview of a
+        mapped pack loads the mesh without copying it.
+    """
+    magic, version, submesh_count = _COOKED_HEADER.unpack_from(buffer, 0)
+    if magic != b"RMSH":
+        raise ValueError("Invalid cooked mesh.")
+    if version != COOKED_MESH_VERSION:
+        raise ValueError(f"Unsupported cooked mesh version {version}.")
+
+    names_offset = _COOKED_HEADER.size + _COOKED_SUBMESH.size * submesh_count
+
+    submeshes = []
+    for index in range(submesh_count):
+        (name_offset, name_length, index_size, vertex_count, index_count,
+         *_, vertex_offset, index_offset, layout, level) = _COOKED_SUBMESH.unpack_from(buffer, _COOKED_HEADER.size + _COOKED_SUBMESH.size * index)
+
+        start = names_offset + name_offset
+        name = bytes(buffer[start:start + name_length]).decode("utf-8")
+
+        if layout == LAYOUT_COMPACT:
+            vertices = np.frombuffer(buffer, dtype=COMPACT_VERTEX_DTYPE, count=vertex_count, offset=vertex_offset)
+        else:
+            vertices = np.frombuffer(buffer, dtype=np.float32, count=vertex_count * VERTEX_FLOATS, offset=vertex_offset).reshape(vertex_count, VERTEX_FLOATS)
+        indices = np.frombuffer(buffer, dtype=np.uint16 if index_size == 2 else np.uint32, count=index_count, offset=index_offset)
+
+        if level > 0 and submeshes:
+            submeshes[-1].lods.append(SubmeshData(name, vertices, indices, layout, lod_level=level))
+        else:
+            submeshes.append(SubmeshData(name, vertices, indices, layout))
+
+    return submeshes
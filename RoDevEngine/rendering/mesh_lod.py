@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import numpy as np
+
+from .mesh_data import SubmeshData, LAYOUT_FLOAT, _index_dtype
+from .mesh_optimizer import optimize_submesh, optimize_vertex_fetch
+
+# Triangle count of each generated level relative to the full mesh, LOD 1 first
+LOD_RATIOS = (0.5, 0.2)
+
+# Meshes smaller than this are cheap enough to always draw at full detail
+LOD_MIN_TRIANGLES = 512
+
+def _cluster(positions: np.ndarray, buckets: np.ndarray, triangles: np.ndarray, resolution: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Snaps vertices to a resolution^3 grid over the mesh bounds, keeping vertices of different normal buckets apart.
+        Returns the cluster of every vertex and the triangles that survive the collapse.
+    """
+    low = positions.min(axis=0)
+    extent = max(float((positions.max(axis=0) - low).max()), 1e-12)
+
+    cells = np.clip(((positions - low) / extent * resolution).astype(np.int64), 0, resolution - 1)
+    keys = ((cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]) * 6 + buckets
+    _, cluster_of = np.unique(keys, return_inverse=True)
+    cluster_of = cluster_of.ravel()
+
+    collapsed = cluster_of[triangles]
+    keep = (collapsed[:, 0] != collapsed[:, 1]) & (collapsed[:, 1] != collapsed[:, 2]) & (collapsed[:, 0] != collapsed[:, 2])
+    collapsed = collapsed[keep]
+
+    # Triangles collapsed onto the same three clusters are drawn once
+    _, first = np.unique(np.sort(collapsed, axis=1), axis=0, return_index=True)
+    return cluster_of, collapsed[np.sort(first)]
+
+def simplify(submesh: SubmeshData, ratio: float) -> SubmeshData:
+    """
+        Simplifies a LAYOUT_FLOAT submesh to roughly ratio of its triangles by vertex clustering.
+        Each cluster is placed where it minimizes the summed quadric error of the faces around it
+        (Garland and Heckbert), which keeps silhouettes and flat areas in place far better than averaging.
+    """
+    vertices = np.asarray(submesh.vertices, dtype=np.float32)
+    triangles = np.asarray(submesh.indices, dtype=np.int64).reshape(-1, 3)
+    target = max(int(len(triangles) * ratio), 1)
+
+    positions = vertices[:, 0:3].astype(np.float64)
+    normals = vertices[:, 3:6]
+
+    # Hard edges have a vertex per side with different normals, keep the sides apart so they don't smear together
+    axis = np.abs(normals).argmax(axis=1)
+    buckets = axis * 2 + (normals[np.arange(len(normals)), axis] < 0)
+
+    # Largest grid that gets the triangle count under the target
+    low_resolution, high_resolution = 1, 1024
+    cluster_of, collapsed = _cluster(positions, buckets, triangles, low_resolution)
+    while high_resolution - low_resolution > 1:
+        resolution = (low_resolution + high_resolution) // 2
+        candidate = _cluster(positions, buckets, triangles, resolution)
+        if len(candidate[1]) <= target:
+            low_resolution = resolution
+            cluster_of, collapsed = candidate
+        else:
+            high_resolution = resolution
+
+    cluster_count = int(cluster_of.max()) + 1
+
+    # Plane quadric of every face, area weighted, summed into the clusters of its corners
+    corners = positions[triangles]
+    face_normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = np.linalg.norm(face_normals, axis=1)
+    unit_normals = face_normals / np.maximum(areas, 1e-20)[:, None]
+    distances = -np.einsum("ij,ij->i", unit_normals, corners[:, 0])
+
+    face_a = areas[:, None, None] * unit_normals[:, :, None] * unit_normals[:, None, :]
+    face_b = areas[:, None] * distances[:, None] * unit_normals
+
+    quadric_a = np.zeros((cluster_count, 3, 3))
+    quadric_b = np.zeros((cluster_count, 3))
+    for corner in range(3):
+        np.add.at(quadric_a, cluster_of[triangles[:, corner]], face_a)
+        np.add.at(quadric_b, cluster_of[triangles[:, corner]], face_b)
+
+    counts = np.bincount(cluster_of, minlength=cluster_count)[:, None]
+    mean_positions = np.zeros((cluster_count, 3))
+    np.add.at(mean_positions, cluster_of, positions)
+    mean_positions /= counts
+
+    # Solve for the error minimizing point, pulled slightly towards the mean so flat or
+    # straight clusters (singular quadrics) stay put instead of flying off
+    regularization = 1e-3 * np.trace(quadric_a, axis1=1, axis2=2)[:, None] / 3 + 1e-12
+    system = quadric_a + regularization[:, :, None] * np.eye(3)
+    placed = np.linalg.solve(system, (regularization * mean_positions - quadric_b)[:, :, None])[:, :, 0]
+
+    # Never leave the cluster's neighbourhood
+    cluster_size = np.zeros(cluster_count)
+    np.maximum.at(cluster_size, cluster_of, np.linalg.norm(positions - mean_positions[cluster_of], axis=1))
+    strays = np.linalg.norm(placed - mean_positions, axis=1) > 2 * cluster_size + 1e-9
+    placed[strays] = mean_positions[strays]
+
+    out = np.zeros((cluster_count, vertices.shape[1]), dtype=np.float32)
+    out[:, 0:3] = placed
+    np.add.at(out[:, 3:], cluster_of, vertices[:, 3:])
+    out[:, 6:8] /= counts
+    out[:, 3:6] /= np.maximum(np.linalg.norm(out[:, 3:6], axis=1), 1e-12)[:, None]
+
+    out, indices = optimize_vertex_fetch(out, collapsed.ravel())
+    return SubmeshData(submesh.name, out, indices.astype(_index_dtype(len(out))), LAYOUT_FLOAT)
+
+def generate_lods(submesh: SubmeshData, ratios=LOD_RATIOS, min_triangles: int = LOD_MIN_TRIANGLES) -> list[SubmeshData]:
+    """
+        Builds the cache optimized LOD levels of a LAYOUT_FLOAT submesh, coarsest last.
+        Levels that wouldn't remove anything are skipped, the rest keep their ratio's slot in lod_level,
+        so a skipped level never moves a coarser one closer to the camera.
+    """
+    triangle_count = len(submesh.indices) // 3
+    if triangle_count < min_triangles:
+        return []
+
+    lods = []
+    for level, ratio in enumerate(ratios, 1):
+        lod = simplify(submesh, ratio)
+        if len(lod.indices) == 0 or len(lod.indices) // 3 >= (len(lods[-1].indices) if lods else len(submesh.indices)) // 3:
+            continue
+
+        lod = optimize_submesh(lod)[0]
+        lod.lod_level = level
+        lods.append(lod)
+
+    return lods
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .mesh_data import SubmeshData
+
+# Post-transform cache size to optimize for, small enough to be a win on every GPU
+CACHE_SIZE = 16
+
+@dataclass
+class OptimizeStats:
+    triangles: int
+    acmr_before: float   # average cache miss ratio: transformed vertices per triangle, 0.5 is ideal, 3 is worst
+    acmr_after: float
+
+def cache_miss_ratio(indices: np.ndarray, cache_size: int = CACHE_SIZE) -> float:
+    """
+        Simulates a FIFO post-transform cache and returns the average cache miss ratio (ACMR).
+    """
+    triangle_count = len(indices) // 3
+    if triangle_count == 0:
+        return 0.0
+
+    cache = []
+    in_cache = set()
+    misses = 0
+    for index in indices.tolist():
+        if index in in_cache:
+            continue
+
+        misses += 1
+        cache.append(index)
+        in_cache.add(index)
+        if len(cache) > cache_size:
+            in_cache.discard(cache.pop(0))
+
+    return misses / triangle_count
+
+def _vertex_triangles(indices: np.ndarray, vertex_count: int) -> tuple[list[int], list[int]]:
+    # Flattened vertex -> triangle adjacency: the triangles of vertex v are triangles[offsets[v]:offsets[v + 1]]
+    counts = np.bincount(indices, minlength=vertex_count)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    triangles = np.argsort(indices, kind="stable") // 3
+    return offsets.tolist(), triangles.tolist()
+
+def optimize_vertex_cache(indices: np.ndarray, vertex_count: int, cache_size: int = CACHE_SIZE) -> tuple[np.ndarray, list[int]]:
+    """
+        Reorders triangles for post-transform cache reuse with Tipsify (Sander, Nehab and Barczak 2007).
+        Returns the new indices and the triangle each cluster starts at: a new cluster starts whenever
+        the walk hits a dead end and has to jump, which is what the overdraw pass reorders.
+    """
+    triangle_count = len(indices) // 3
+    if triangle_count == 0:
+        return indices, []
+
+    flat = indices.tolist()
+    offsets, vertex_triangles = _vertex_triangles(indices, vertex_count)
+
+    live = np.bincount(indices, minlength=vertex_count).tolist()
+    cache_time = [0] * vertex_count
+    emitted = bytearray(triangle_count)
+
+    output = []
+    clusters = [0]
+    dead_end = []
+
+    time = cache_size + 1
+    cursor = 0
+    fan = flat[0]
+
+    while fan >= 0:
+        candidates = []
+        for triangle in vertex_triangles[offsets[fan]:offsets[fan + 1]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = 1
+
+            for vertex in flat[triangle * 3:triangle * 3 + 3]:
+                output.append(vertex)
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+
+                if time - cache_time[vertex] > cache_size:
+                    cache_time[vertex] = time
+                    time += 1
+
+        # Next fan: the candidate that will still be in the cache after its remaining triangles, oldest first
+        fan = -1
+        best = -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                priority = 0
+                if time - cache_time[vertex] + 2 * live[vertex] <= cache_size:
+                    priority = time - cache_time[vertex]
+                if priority > best:
+                    best = priority
+                    fan = vertex
+
+        if fan == -1:
+            while dead_end:
+                vertex = dead_end.pop()
+                if live[vertex] > 0:
+                    fan = vertex
+                    break
+            else:
+                while cursor < vertex_count:
+                    if live[cursor] > 0:
+                        fan = cursor
+                        break
+                    cursor += 1
+
+            if fan != -1 and len(output) // 3 < triangle_count:
+                clusters.append(len(output) // 3)
+
+    return np.array(output, dtype=indices.dtype), clusters
+
+def optimize_overdraw(indices: np.ndarray, positions: np.ndarray, clusters: list[int]) -> np.ndarray:
+    """
+        Orders the clusters of a cache optimized index buffer so outward facing ones, which are
+        the most likely to occlude the rest of the mesh, are drawn first. Triangles inside a cluster keep
+        their order, so cache efficiency only drops at cluster boundaries.
+    """
+    triangle_count = len(indices) // 3
+    if len(clusters) < 2:
+        return indices
+
+    triangles = indices.reshape(-1, 3)
+    corners = positions[triangles].astype(np.float64)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    centroids = corners.mean(axis=1)
+
+    bounds = np.array(clusters + [triangle_count])
+    cluster_of = np.repeat(np.arange(len(clusters)), np.diff(bounds))
+
+    # Area weighted cluster normal and centroid, summed per cluster
+    areas = np.linalg.norm(normals, axis=1)
+    cluster_normal = np.zeros((len(clusters), 3))
+    cluster_centroid = np.zeros((len(clusters), 3))
+    np.add.at(cluster_normal, cluster_of, normals)
+    np.add.at(cluster_centroid, cluster_of, centroids * areas[:, None])
+    cluster_area = np.bincount(cluster_of, weights=areas, minlength=len(clusters))
+    cluster_centroid /= np.maximum(cluster_area, 1e-12)[:, None]
+
+    mesh_centroid = (centroids * areas[:, None]).sum(axis=0) / max(areas.sum(), 1e-12)
+    score = np.einsum("ij,ij->i", cluster_centroid - mesh_centroid, cluster_normal)
+
+    order = np.argsort(-score, kind="stable")
+    triangle_order = np.concatenate([np.arange(bounds[cluster], bounds[cluster + 1]) for cluster in order])
+    return triangles[triangle_order].ravel()
+
+def optimize_vertex_fetch(vertices: np.ndarray, indices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Renumbers vertices in the order the index buffer first uses them, so vertex fetches walk
+        memory forwards. Unreferenced vertices are dropped.
+    """
+    if len(indices) == 0:
+        return vertices[:0], indices
+
+    _, first = np.unique(indices, return_index=True)
+    order = indices[np.sort(first)]
+
+    remap = np.empty(len(vertices), dtype=np.int64)
+    remap[order] = np.arange(len(order))
+
+    return vertices[order], remap[indices].astype(indices.dtype)
+
+def optimize_submesh(submesh: SubmeshData, overdraw: bool = False, cache_size: int = CACHE_SIZE) -> tuple[SubmeshData, OptimizeStats]:
+    """
+        Runs the vertex cache, optional overdraw, then vertex fetch passes over a submesh.
+    """
+    indices = np.ascontiguousarray(submesh.indices)
+    acmr_before = cache_miss_ratio(indices, cache_size)
+
+    optimized, clusters = optimize_vertex_cache(indices, len(submesh.vertices), cache_size)
+    if overdraw:
+        optimized = optimize_overdraw(optimized, submesh.positions, clusters)
+
+    # Tipsify can lose to an already good order on small meshes, keep whichever is better
+    acmr_after = cache_miss_ratio(optimized, cache_size)
+    if overdraw or acmr_after <= acmr_before:
+        indices = optimized
+    else:
+        acmr_after = acmr_before
+
+    # Renumbering vertices doesn't change the order they're used in, so the ACMR stays the same
+    vertices, indices = optimize_vertex_fetch(submesh.vertices, indices)
+
+    stats = OptimizeStats(len(indices) // 3, acmr_before, acmr_after)
+    return SubmeshData(submesh.name, vertices, indices, submesh.layout), stats
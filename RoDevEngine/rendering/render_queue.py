@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from OpenGL import GL
+import pyglm.glm as glm
+
+from .instancing import can_instance, draw_instanced
+from .render_state import RenderState
+
+# Sort key layout, most significant bits first:
+#   opaque:      0 | shader (10) | material (14) | mesh (15) | depth (24), front to back
+#   transparent: 1 | inverted depth (24) | shader (10) | material (14) | mesh (15), back to front
+_SHADER_BITS = 10
+_MATERIAL_BITS = 14
+_MESH_BITS = 15
+_DEPTH_BITS = 24
+
+_DEPTH_MAX = (1 << _DEPTH_BITS) - 1
+_TRANSPARENT = 1 << 63
+
+class RenderQueue:
+    """
+        Meshes submit what they want drawn while the scene updates, flush() then sorts everything by a packed 64 bit key
+        and draws it. Opaque items are grouped by shader, material and mesh to keep state changes down, nearest first
+        within a group; transparent items are drawn after them, farthest first, with blending on. \n
+        Consecutive items sharing material and mesh are drawn with one instanced call when the shader has an instanced variant.
+    """
+    _instance = None
+    _created = False
+
+    # Draw runs of the same mesh and material with glDrawElementsInstanced
+    INSTANCING = True
+
+    # Items farther than this from the camera all sort as equally far
+    MAX_DEPTH = 1000.0
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RenderQueue, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if RenderQueue._created:
+            return
+
+        # (key, material, mesh buffers, model matrix)
+        self.items: list[tuple[int, object, dict, glm.mat4]] = []
+        self.view_pos = glm.vec3(0)
+
+        # Small stable numbers for the shaders, materials and meshes seen so far, packed into the keys
+        self._ids: dict[tuple, int] = {}
+
+        # Last flush, for profiling
+        self.draw_calls = 0
+        self.instances = 0
+
+        RenderQueue._created = True
+
+    def begin(self, view_pos: glm.vec3):
+        """
+            Starts a frame drawn from view_pos, which depth sorting is relative to.
+        """
+        self.view_pos = glm.vec3(view_pos)
+
+    def _id(self, key: tuple, bits: int) -> int:
+        number = self._ids.get(key)
+        if number is None:
+            number = self._ids[key] = len(self._ids)
+        return number & ((1 << bits) - 1)
+
+    def submit(self, material, shared: dict, model: glm.mat4):
+        """
+            Queues a draw of a mesh, shared being its buffer entry (vao, count, index_type), with a material and model matrix.
+        """
+        distance = glm.distance(glm.vec3(model[3]), self.view_pos)
+        depth = int(min(distance / RenderQueue.MAX_DEPTH, 1.0) * _DEPTH_MAX)
+
+        state = self._id(("shader", id(material.shader)), _SHADER_BITS)
+        state = (state << _MATERIAL_BITS) | self._id(("material", id(material)), _MATERIAL_BITS)
+        state = (state << _MESH_BITS) | self._id(("mesh", int(shared["vao"])), _MESH_BITS)
+
+        if material.transparent:
+            key = _TRANSPARENT | ((_DEPTH_MAX - depth) << (_SHADER_BITS + _MATERIAL_BITS + _MESH_BITS)) | state
+        else:
+            key = (state << _DEPTH_BITS) | depth
+
+        self.items.append((key, material, shared, model))
+
+    def flush(self):
+        """
+            Sorts and draws everything submitted since the last flush.
+        """
+        items = self.items
+        items.sort(key=lambda item: item[0])
+
+        render_state = RenderState()
+        self.draw_calls = 0
+        self.instances = len(items)
+
+        bound = None
+        blending = False
+
+        start = 0
+        while start < len(items):
+            key, material, shared, model = items[start]
+
+            if key & _TRANSPARENT and not blending:
+                # Transparent surfaces blend over what's behind them and don't hide each other
+                render_state.set_enabled(GL.GL_BLEND, True)
+                render_state.set_blend_func(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+                render_state.set_depth_mask(False)
+                blending = True
+
+            end = start + 1
+            while end < len(items) and items[end][1] is material and items[end][2] is shared:
+                end += 1
+
+            if end - start > 1 and RenderQueue.INSTANCING and can_instance(material):
+                if bound != (material, True):
+                    material.use(instanced=True)
+                    bound = (material, True)
+
+                draw_instanced(shared, [items[index][3].to_bytes() for index in range(start, end)])
+                self.draw_calls += 1
+
+            else:
+                if bound != (material, False):
+                    material.use()
+                    bound = (material, False)
+
+                render_state.bind_vertex_array(shared["vao"])
+                for index in range(start, end):
+                    material.shader.set_mat4("uModel", items[index][3])
+                    GL.glDrawElements(GL.GL_TRIANGLES, shared["count"], shared["index_type"], None)
+                    self.draw_calls += 1
+
+            start = end
+
+        if blending:
+            render_state.set_depth_mask(True)
+            render_state.set_enabled(GL.GL_BLEND, False)
+
+        items.clear()
+
+    def discard(self):
+        """
+            Drops everything submitted since the last flush without drawing it, and forgets the sort ids.
+            Called on scene switches, since the old scene's buffers may be freed before the next flush.
+        """
+        self.items.clear()
+        self._ids.clear()
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from OpenGL import GL
+
+class RenderState:
+    """
+        Shadow copy of the GL state the engine touches: program, texture units, VAO, buffer bindings, enabled
+        capabilities, depth, blend and cull settings. Every bind made through it that wouldn't change anything is skipped,
+        which matters because each PyOpenGL call is expensive. \n
+        Code that changes GL state behind its back (the editor UI renderer, deleting bound objects) must call invalidate().
+    """
+    _instance = None
+    _created = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RenderState, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if RenderState._created:
+            return
+
+        self.invalidate()
+
+        # GL calls made and skipped since begin_frame
+        self.calls = 0
+        self.skipped = 0
+
+        RenderState._created = True
+
+    def invalidate(self):
+        """
+            Forgets everything, the next bind of each kind always reaches GL.
+        """
+        self.program = None
+        self.active_unit = None
+        self.textures: dict[tuple[int, int], int] = {}     # (unit, target) -> texture
+        self.vertex_array = None
+        self.buffers: dict[int, int] = {}                   # target -> buffer
+        self.capabilities: dict[int, bool] = {}
+        self.depth_mask = None
+        self.depth_func = None
+        self.cull_face = None
+        self.blend_func = None
+
+    def begin_frame(self):
+        """
+            Resets the counters, call once at the start of every frame.
+        """
+        self.calls = 0
+        self.skipped = 0
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "skipped": self.skipped}
+
+    def _changed(self, current, value) -> bool:
+        if current == value:
+            self.skipped += 1
+            return False
+
+        self.calls += 1
+        return True
+
+    def use_program(self, program: int):
+        if self._changed(self.program, program):
+            GL.glUseProgram(program)
+            self.program = program
+
+    def forget_program(self, program: int):
+        # A deleted program that was in use is no longer bound once GL lets go of it
+        if self.program == program:
+            self.program = None
+
+    def bind_texture(self, texture: int, unit: int = 0, target: int = GL.GL_TEXTURE_2D):
+        if not self._changed(self.textures.get((unit, target)), texture):
+            return
+
+        if self.active_unit != unit:
+            GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+            self.active_unit = unit
+            self.calls += 1
+
+        GL.glBindTexture(target, texture)
+        self.textures[(unit, target)] = texture
+
+    def forget_texture(self, texture: int):
+        for key, bound in list(self.textures.items()):
+            if bound == texture:
+                self.textures[key] = 0
+
+    def bind_vertex_array(self, vertex_array: int):
+        if self._changed(self.vertex_array, vertex_array):
+            GL.glBindVertexArray(vertex_array)
+            self.vertex_array = vertex_array
+
+            # The element buffer binding is part of the VAO
+            self.buffers.pop(GL.GL_ELEMENT_ARRAY_BUFFER, None)
+
+    def forget_vertex_array(self, vertex_array: int):
+        if self.vertex_array == vertex_array:
+            self.vertex_array = 0
+            self.buffers.pop(GL.GL_ELEMENT_ARRAY_BUFFER, None)
+
+    def bind_buffer(self, target: int, buffer: int):
+        if self._changed(self.buffers.get(target), buffer):
+            GL.glBindBuffer(target, buffer)
+            self.buffers[target] = buffer
+
+    def forget_buffer(self, buffer: int):
+        for target, bound in list(self.buffers.items()):
+            if bound == buffer:
+                self.buffers[target] = 0
+
+    def set_enabled(self, capability: int, enabled: bool):
+        if self._changed(self.capabilities.get(capability), enabled):
+            if enabled:
+                GL.glEnable(capability)
+            else:
+                GL.glDisable(capability)
+            self.capabilities[capability] = enabled
+
+    def set_depth_mask(self, write: bool):
+        if self._changed(self.depth_mask, write):
+            GL.glDepthMask(GL.GL_TRUE if write else GL.GL_FALSE)
+            self.depth_mask = write
+
+    def set_depth_func(self, func: int):
+        if self._changed(self.depth_func, func):
+            GL.glDepthFunc(func)
+            self.depth_func = func
+
+    def set_blend_func(self, source: int, destination: int):
+        if self._changed(self.blend_func, (source, destination)):
+            GL.glBlendFunc(source, destination)
+            self.blend_func = (source, destination)
+
+    def set_cull_face(self, face: int):
+        if self._changed(self.cull_face, face):
+            GL.glCullFace(face)
+            self.cull_face = face
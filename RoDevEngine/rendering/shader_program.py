@@ -1,5 +1,8 @@
+from __future__ import annotations
+
 from OpenGL.GL import *
 from ..core.logger import Logger
+from .render_state import RenderState
 from ..scripts.light import Pointlight, Spotlight
 from pyglm import glm
 import numpy as np
@@ -44,11 +47,35 @@ class SpotLightUBO(ctypes.Structure):
 class ShaderProgram:
     MAX_LIGHTS = 64
 
-    def __init__(self, vertex_src, fragment_src):
+    def __init__(self, vertex_src, fragment_src, instanced_vertex_src=None):
+        """
+            instanced_vertex_src: variant of the vertex shader reading the model matrix from the per-instance
+            aModel attribute instead of the uModel uniform. Compiled with the same fragment shader into
+            self.instanced, which the instanced render path draws with.
+        """
         self.vertex_src = vertex_src
         self.fragment_src = fragment_src
+
+        # Filled once after linking: uniform name -> (location, GL type), light block name -> block index
+        self.uniforms: dict[str, tuple[int, int]] = {}
+        self.uniform_blocks: dict[str, int] = {}
+
+        # Last value uploaded per uniform, setting the same value again makes no GL call
+        self._uniform_values: dict[str, object] = {}
+
         self.program_id = self._create_shader_program()
 
+        self.instanced: ShaderProgram = None
+        if instanced_vertex_src:
+            self.instanced = ShaderProgram(instanced_vertex_src, fragment_src)
+
+    @property
+    def variants(self) -> list[ShaderProgram]:
+        """
+            This program and its instanced variant, per frame uniforms have to be set on all of them.
+        """
+        return [self] if self.instanced is None else [self, self.instanced]
+
 
     def _create_shader_program(self):
         vertex_shader = glCreateShader(GL_VERTEX_SHADER)
@@ -73,11 +100,33 @@ class ShaderProgram:
         glDeleteShader(vertex_shader)
         glDeleteShader(fragment_shader)
 
+        self._query_uniforms(program)
+
         # ---------- UBO SETUP ----------
         self._setup_light_ubos(program)
 
         return program
 
+    def _query_uniforms(self, program):
+        for index in range(glGetProgramiv(program, GL_ACTIVE_UNIFORMS)):
+            name, size, uniform_type = glGetActiveUniform(program, index)
+            if isinstance(name, bytes):
+                name = name.decode()
+
+            # Uniforms inside blocks have no location, they're set through the block's buffer
+            location = glGetUniformLocation(program, name)
+            if location == -1:
+                continue
+
+            self.uniforms[name] = (location, uniform_type)
+
+            # Arrays are listed once as name[0], every element is still looked up by its own name
+            if name.endswith("[0]"):
+                base = name[:-3]
+                self.uniforms[base] = (location, uniform_type)
+                for element in range(1, size):
+                    self.uniforms[f"{base}[{element}]"] = (glGetUniformLocation(program, f"{base}[{element}]"), uniform_type)
+
     def _handle_shader_error(self, shader, stage):
         if not glGetShaderiv(shader, GL_COMPILE_STATUS):
             error = glGetShaderInfoLog(shader).decode()
@@ -87,7 +136,7 @@ class ShaderProgram:
     def _setup_light_ubos(self, program):
         # ---------- Point Lights ----------
         self.point_light_ubo = glGenBuffers(1)
-        glBindBuffer(GL_UNIFORM_BUFFER, self.point_light_ubo)
+        RenderState().bind_buffer(GL_UNIFORM_BUFFER, self.point_light_ubo)
         glBufferData(
             GL_UNIFORM_BUFFER,
             self.MAX_LIGHTS * ctypes.sizeof(PointLightUBO),
@@ -96,6 +145,7 @@ class ShaderProgram:
         )
 
         block_index = glGetUniformBlockIndex(program, "PointLightBlock")
+        self.uniform_blocks["PointLightBlock"] = block_index
         if block_index != GL_INVALID_INDEX:
             glUniformBlockBinding(program, block_index, 0)
             glBindBufferBase(GL_UNIFORM_BUFFER, 0, self.point_light_ubo)
@@ -104,7 +154,7 @@ class ShaderProgram:
 
         # ---------- Spot Lights ----------
         self.spot_light_ubo = glGenBuffers(1)
-        glBindBuffer(GL_UNIFORM_BUFFER, self.spot_light_ubo)
+        RenderState().bind_buffer(GL_UNIFORM_BUFFER, self.spot_light_ubo)
         glBufferData(
             GL_UNIFORM_BUFFER,
             self.MAX_LIGHTS * ctypes.sizeof(SpotLightUBO),
@@ -113,77 +163,71 @@ class ShaderProgram:
         )
 
         block_index = glGetUniformBlockIndex(program, "SpotLightBlock")
+        self.uniform_blocks["SpotLightBlock"] = block_index
         if block_index != GL_INVALID_INDEX:
             glUniformBlockBinding(program, block_index, 1)
             glBindBufferBase(GL_UNIFORM_BUFFER, 1, self.spot_light_ubo)
         else:
             Logger("SHADER").log_warning("SpotLightBlock not found in shader.")
 
-        glBindBuffer(GL_UNIFORM_BUFFER, 0)
-
     def use(self):
-        glUseProgram(self.program_id)
+        RenderState().use_program(self.program_id)
 
-    def _use_shader(func):
-        def wrapper(self, *args, **kwargs):
-            self.use()
-            return func(self, *args, **kwargs)
-        return wrapper
+    def _changed(self, name: str, value) -> int:
+        """
+            Returns where to upload value, or -1 when the uniform doesn't exist or already holds it.
+            Binds the program when there is something to upload.
+        """
+        uniform = self.uniforms.get(name)
+        if uniform is None or self._uniform_values.get(name) == value:
+            return -1
+
+        self._uniform_values[name] = value
+        self.use()
+        return uniform[0]
 
-    @_use_shader
     def set_mat4(self, name: str, matrix: glm.mat4x4):
-        loc = glGetUniformLocation(self.program_id, name)
+        # Copied, so changing the caller's matrix later doesn't change the cached value
+        loc = self._changed(name, glm.mat4(matrix))
         if loc != -1:
             glUniformMatrix4fv(loc, 1, GL_FALSE, glm.value_ptr(matrix))
 
-    @_use_shader
     def set_mat3(self, name: str, matrix: glm.mat3):
-        loc = glGetUniformLocation(self.program_id, name)
+        loc = self._changed(name, glm.mat3(matrix))
         if loc != -1:
             glUniformMatrix3fv(loc, 1, GL_FALSE, glm.value_ptr(matrix))
 
-    @_use_shader
     def set_vec3(self, name: str, vector):
-        if not isinstance(vector, glm.vec3):
-            vector = glm.vec3(*vector)
-        loc = glGetUniformLocation(self.program_id, name)
+        vector = glm.vec3(*vector) if not isinstance(vector, glm.vec3) else glm.vec3(vector)
+        loc = self._changed(name, vector)
         if loc != -1:
             glUniform3fv(loc, 1, glm.value_ptr(vector))
 
-    @_use_shader
     def set_vec2(self, name: str, vector):
-        if not isinstance(vector, glm.vec2):
-            vector = glm.vec2(*vector)
-        loc = glGetUniformLocation(self.program_id, name)
+        vector = glm.vec2(*vector) if not isinstance(vector, glm.vec2) else glm.vec2(vector)
+        loc = self._changed(name, vector)
         if loc != -1:
             glUniform2fv(loc, 1, glm.value_ptr(vector))
 
-    @_use_shader
     def set_float(self, name: str, value: float):
-        loc = glGetUniformLocation(self.program_id, name)
+        loc = self._changed(name, float(value))
         if loc != -1:
             glUniform1f(loc, value)
 
-    @_use_shader
     def set_int(self, name: str, value: int):
-        loc = glGetUniformLocation(self.program_id, name)
+        loc = self._changed(name, int(value))
         if loc != -1:
             glUniform1i(loc, value)
     
-    @_use_shader
     def set_bool(self, name: str, value: bool):
-        loc = glGetUniformLocation(self.program_id, name)
+        loc = self._changed(name, int(value))
         if loc != -1:
             glUniform1i(loc, int(value))
 
-    @_use_shader
     def set_point_lights(self, lights: list[Pointlight]):
-        glUniform1i(
-            glGetUniformLocation(self.program_id, "uNumPointLights"),
-            len(lights)
-        )
+        self.set_int("uNumPointLights", len(lights))
 
-        glBindBuffer(GL_UNIFORM_BUFFER, self.point_light_ubo)
+        RenderState().bind_buffer(GL_UNIFORM_BUFFER, self.point_light_ubo)
 
         for i, light in enumerate(lights):
             data = PointLightUBO(
@@ -210,16 +254,10 @@ class ShaderProgram:
                 ctypes.byref(data)
             )
 
-        glBindBuffer(GL_UNIFORM_BUFFER, 0)
-
-    @_use_shader
     def set_spot_lights(self, lights: list[Spotlight]):
-        glUniform1i(
-            glGetUniformLocation(self.program_id, "uNumSpotLights"),
-            len(lights)
-        )
+        self.set_int("uNumSpotLights", len(lights))
 
-        glBindBuffer(GL_UNIFORM_BUFFER, self.spot_light_ubo)
+        RenderState().bind_buffer(GL_UNIFORM_BUFFER, self.spot_light_ubo)
 
         for i, light in enumerate(lights):
             direction = light.gameobject.transform.forward
@@ -250,12 +288,14 @@ class ShaderProgram:
                 ctypes.byref(data)
             )
 
-        glBindBuffer(GL_UNIFORM_BUFFER, 0)
-
     def delete(self):
         if self.program_id:
+            RenderState().forget_program(self.program_id)
             glDeleteProgram(self.program_id)
             self.program_id = 0
 
+        if self.instanced:
+            self.instanced.delete()
+
     def __str__(self):
         return f"ShaderProgram<{self.program_id}>"
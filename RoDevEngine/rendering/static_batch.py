@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import numpy as np
+
+from .mesh_data import SubmeshData, LAYOUT_COMPACT, VERTEX_FLOATS, expand_vertices, _index_dtype
+
+def merge_static_geometry(name: str, parts: list[tuple[SubmeshData, np.ndarray]]) -> SubmeshData:
+    """
+        Pre-transforms every (submesh, 4x4 model matrix) into world space and merges them into a single
+        LAYOUT_FLOAT submesh, drawn with an identity model matrix.
+    """
+    vertex_count = sum(len(submesh.vertices) for submesh, _ in parts)
+    index_count = sum(len(submesh.indices) for submesh, _ in parts)
+
+    vertices = np.empty((vertex_count, VERTEX_FLOATS), dtype=np.float32)
+    indices = np.empty(index_count, dtype=_index_dtype(vertex_count))
+
+    vertex_offset = 0
+    index_offset = 0
+    for submesh, model in parts:
+        source = expand_vertices(submesh.vertices) if submesh.layout == LAYOUT_COMPACT else np.asarray(submesh.vertices, dtype=np.float32)
+        out = vertices[vertex_offset:vertex_offset + len(source)]
+
+        linear = model[:3, :3]
+        out[:, 0:3] = source[:, 0:3] @ linear.T + model[:3, 3]
+
+        # Normals go through the inverse transpose, which keeps them perpendicular under non-uniform scale
+        normals = source[:, 3:6] @ np.linalg.inv(linear)
+        out[:, 3:6] = normals / np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+        out[:, 6:8] = source[:, 6:8]
+
+        indices[index_offset:index_offset + len(submesh.indices)] = np.asarray(submesh.indices).astype(indices.dtype) + vertex_offset
+
+        vertex_offset += len(source)
+        index_offset += len(submesh.indices)
+
+    return SubmeshData(name, vertices, indices)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import PIL.Image as image
+
+import io
+import struct
+
+BAKED_TEXTURE_SUFFIX = ".rtex"
+BAKED_TEXTURE_VERSION = 1
+
+FORMAT_RGBA8 = 1
+
+# Header: magic (4s), version (H), pixel format (H), width (I), height (I), mip count (H), reserved (H)
+_BAKED_HEADER = struct.Struct("<4sHHIIHH")
+# Mip level: width (I), height (I), data offset (Q), data size (Q)
+_BAKED_LEVEL = struct.Struct("<IIQQ")
+
+_ALIGNMENT = 16
+
+@dataclass
+class BakedTexture:
+    width: int
+    height: int
+    # (width, height, RGBA8 pixels) per mip level, level 0 being the full size image
+    levels: list[tuple[int, int, memoryview]]
+
+def bake_texture(data: bytes) -> bytes:
+    """
+        Build step for images. Decodes the image once, flips it for GL and stores every mip level as raw RGBA8. \n
+        Levels are written smallest first, so the low resolution mips sit together at the start of the blob.
+    """
+    img = image.open(io.BytesIO(data)).convert("RGBA").transpose(image.FLIP_TOP_BOTTOM)
+
+    levels = [img]
+    while levels[-1].size != (1, 1):
+        width, height = levels[-1].size
+        levels.append(levels[-1].resize((max(width // 2, 1), max(height // 2, 1)), image.BOX))
+
+    # Header followed by the level table, filled in as the levels are written
+    table_size = _BAKED_HEADER.size + _BAKED_LEVEL.size * len(levels)
+    out = bytearray(table_size)
+    _BAKED_HEADER.pack_into(out, 0, b"RTEX", BAKED_TEXTURE_VERSION, FORMAT_RGBA8, *img.size, len(levels), 0)
+
+    for index in reversed(range(len(levels))):
+        pixels = levels[index].tobytes()
+
+        out += bytes(-len(out) % _ALIGNMENT)
+        _BAKED_LEVEL.pack_into(out, _BAKED_HEADER.size + _BAKED_LEVEL.size * index, *levels[index].size, len(out), len(pixels))
+        out += pixels
+
+    return bytes(out)
+
+def load_baked_texture(buffer) -> BakedTexture:
+    """
+        Reads a baked texture. Level data are views into the buffer, so nothing is copied or decoded.
+    """
+    magic, version, pixel_format, width, height, mip_count, _ = _BAKED_HEADER.unpack_from(buffer, 0)
+    if magic != b"RTEX":
+        raise ValueError("Invalid baked texture.")
+    if version != BAKED_TEXTURE_VERSION or pixel_format != FORMAT_RGBA8:
+        raise ValueError(f"Unsupported baked texture version {version} / format {pixel_format}.")
+
+    view = memoryview(buffer)
+    levels = []
+    for index in range(mip_count):
+        level_width, level_height, offset, size = _BAKED_LEVEL.unpack_from(buffer, _BAKED_HEADER.size + _BAKED_LEVEL.size * index)
+        levels.append((level_width, level_height, view[offset:offset + size]))
+
+    return BakedTexture(width, height, levels)
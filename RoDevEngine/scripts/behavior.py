@@ -44,6 +44,7 @@ class Behavior:
     - on_collision (start and end): Methods called upon collisions
     - update/fixed_update: Methods called every frame/~50th of a second
     - on_scene_load/unload: Methods called upon the loading/unloading of a scene.
+    - on_destroy: Method called when the object is destroyed
     """
     component_category_registry: dict[str, list[Behavior]] = {}
     category = "General"
@@ -135,6 +136,12 @@ class Behavior:
         """
         pass
 
+    def on_destroy(self):
+        """
+            Called when the object is destroyed, for example when its scene unloads. Release GPU resources here.
+        """
+        pass
+
     def on_collision_start(self, other):
         """
         Called upon a collision 'starting', or the first collision between two gameobjects.
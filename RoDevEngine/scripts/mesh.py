@@ -1,26 +1,50 @@
 from .behavior import Behavior, EditorField, InitMethod, register_editor_button
 from ..core.logger import Logger
 
-from ..core.packer import Pack
+from ..core.packer import Pack, CODEC_NONE
 
 from ..object import Object
 from ..rendering.material import Material
+from ..rendering.mesh_data import SubmeshData, parse_obj, iter_obj, read_blocks, load_cooked_mesh, OBJ_BLOCK_SIZE, COOKED_MESH_SUFFIX, LAYOUT_FLOAT, LAYOUT_COMPACT, COMPACT_VERTEX_DTYPE
+from ..rendering.mesh_cache import load_obj, cache_obj, is_cached
+from ..rendering.gpu_resources import GPUResources
+from ..rendering.render_queue import RenderQueue
+from ..rendering.render_state import RenderState
+from ..rendering.static_batch import merge_static_geometry
 from OpenGL import GL
 import pyglm.glm as glm
 import numpy as np
 import hashlib
+from concurrent.futures import Executor
+from typing import Iterable
 
 import os
 
 class Mesh(Behavior):
     category = "Rendering"
 
+    # Upload meshes in the compact vertex layout (quantized normals, half float uvs), meshes cooked compact always are
+    COMPACT_VERTICES = False
+
     # Class-level registry for shared mesh data
     _mesh_registry = {}
 
+    # (mesh_path, mesh_name, source version) -> Submesh.built_entry() per submesh
+    _source_registry = {}
+
+    # (mesh_path, mesh_name, source version) -> submesh data parsed ahead of time by decode_meshes
+    _decoded: dict[tuple, list[SubmeshData]] = {}
+
+    # (mesh_path, mesh_name) used by a static object of the scene being loaded, their vertex data is kept for batching
+    static_sources: set[tuple[str, str]] = set()
+
     mesh_path = EditorField('str', "")
     mesh_name = EditorField('str', "")
 
+    # Switch to LOD 1 / LOD 2 once the mesh covers less than this fraction of the screen's height
+    lod1_screen_size = EditorField('float', 0.25)
+    lod2_screen_size = EditorField('float', 0.08)
+
     run_in_editor = True
 
     def __init__(self, gameobject):
@@ -28,110 +52,154 @@ class Mesh(Behavior):
 
         self.submeshes: list[Submesh] = []
 
-    @InitMethod
-    def create_from_obj(cls, file_path: str, file_name: str, game_object: Object):
-        submeshes = []
-        cur_mesh = None
-
-        positions = []
-        normals = []
-        tex_coords = []
-
-        vertices = []   # interleaved vertex data
-        indices = []
-
-        vertex_map = {}  # (v, vt, vn) -> index
+        self._bounds_center = glm.vec3(0)
+        self._bounds_radius = 0.0
 
-        pos_offset = 0
-        nor_offset = 0
-        tex_offset = 0
+        # Set when the mesh was merged into a StaticBatch, which draws it from then on
+        self.batched = False
 
-        lines = []
+    @staticmethod
+    def _source_version(asset_path: str):
+        """
+            Returns something that changes whenever the mesh's source does: mtime and size in the editor,
+            the pack entry actually loaded when compiled.
+        """
         if not "compiled" in os.environ.keys():
-            with open(os.path.join(*file_path.split("."), file_name)) as file:
-                lines = file.readlines()
-        else:
-            pack = Pack()
-            lines = pack.get_string(os.path.join(*file_path.split("."), file_name)).splitlines()
-
-        for line in lines:
-            if line.startswith("o "):
-                if cur_mesh:
-                    cur_mesh.indices = indices
-                    cur_mesh.vertices = vertices
-
-                    cur_mesh._create_or_get_buffers()
-
-                    submeshes.append(cur_mesh)
-                
-                pos_offset = len(positions)
-                nor_offset = len(normals)
-                tex_offset = len(tex_coords)
-
-                positions.clear()
-                normals.clear()
-                tex_coords.clear()
-
-                vertices.clear()
-                indices.clear()
-
-                vertex_map.clear()
-
-                cur_mesh = Submesh(game_object)
-
-            elif line.startswith("v "):
-                positions.append(tuple(map(float, line.split()[1:4])))
-
-            elif line.startswith("vn "):
-                normals.append(tuple(map(float, line.split()[1:4])))
+            stat = os.stat(asset_path)
+            return (stat.st_mtime_ns, stat.st_size)
 
-            elif line.startswith("vt "):
-                tex_coords.append(tuple(map(float, line.split()[1:3])))
+        pack = Pack()
+        if pack.has(asset_path + COOKED_MESH_SUFFIX):
+            return pack.get_entry(asset_path + COOKED_MESH_SUFFIX)
+        return pack.get_entry(asset_path)
 
-            elif line.startswith("f "):
-                face = line.split()[1:]
-
-                # triangulate face (fan method)
-                for i in range(1, len(face) - 1):
-                    for vert in (face[0], face[i], face[i + 1]):
-
-                        parts = vert.split("/")
-                        v = int(parts[0]) - 1 - pos_offset
-                        vt = int(parts[1]) - 1 - tex_offset if len(parts) > 1 and parts[1] else None
-                        vn = int(parts[2]) - 1 - nor_offset if len(parts) > 2 and parts[2] else None
-
-                        key = (v, vt, vn)
-                        if key not in vertex_map:
-                            px, py, pz = positions[v]
+    @staticmethod
+    def _read_mesh_data(asset_path: str) -> Iterable[SubmeshData]:
+        if not "compiled" in os.environ.keys():
+            # Parsed meshes are cached on disk, so only edited .obj files get parsed again
+            return load_obj(asset_path)
+
+        pack = Pack()
+        # Cooked meshes are viewed straight out of the mapped pack, no parsing or copying
+        if pack.has(asset_path + COOKED_MESH_SUFFIX):
+            return load_cooked_mesh(pack.get_view(asset_path + COOKED_MESH_SUFFIX))
+
+        # Uncooked sources are streamed, each submesh is yielded (and uploaded) as soon as it's parsed.
+        # Compressed ones are decoded block by block too, so the whole text is never held at once
+        return iter_obj(read_blocks(pack.get_io(asset_path, stream=True)))
+
+    @staticmethod
+    def decode_meshes(mesh_assets, pool: Executor):
+        """
+            CPU half of loading meshes: parses every (mesh_path, mesh_name) that isn't built or cached yet
+            on the given process pool and blocks until they are done. Makes no GL calls. \n
+            Mesh instances created afterwards pick the results up, so all that's left for them is the upload.
+        """
+        jobs = {}
+        for file_path, file_name in mesh_assets:
+            asset_path = os.path.join(*file_path.split("."), file_name)
+            try:
+                source_key = (file_path, file_name, Mesh._source_version(asset_path))
+            except (OSError, ValueError):
+                continue
+
+            if source_key in Mesh._source_registry or source_key in Mesh._decoded:
+                continue
+
+            if not "compiled" in os.environ.keys():
+                # Workers fill the disk cache, the main process then maps it
+                if not is_cached(asset_path):
+                    jobs[source_key] = pool.submit(cache_obj, asset_path)
+
+            elif not Pack().has(asset_path + COOKED_MESH_SUFFIX):
+                # Sources too big to send to a worker whole are streamed by the Mesh instead. A compressed entry's
+                # size says nothing about how big its text is, so those are always streamed
+                entry = Pack().get_entry(asset_path)
+                if entry.codec == CODEC_NONE and entry.size <= OBJ_BLOCK_SIZE:
+                    jobs[source_key] = pool.submit(parse_obj, Pack().get_string(asset_path))
+
+        for source_key, job in jobs.items():
+            try:
+                mesh_data = job.result()
+            except Exception as e:
+                Logger("CORE").log_warning(f"Failed to decode mesh {source_key[0]}.{source_key[1]}: {e}")
+                continue
+
+            if mesh_data is not None:
+                Mesh._decoded[source_key] = mesh_data
+
+    @staticmethod
+    def _load_submeshes(file_path: str, file_name: str, game_object: Object) -> list["Submesh"]:
+        asset_path = os.path.join(*file_path.split("."), file_name)
+        source_key = (file_path, file_name, Mesh._source_version(asset_path))
+
+        # Instances of a mesh that was already built share its data and buffers, nothing is read or parsed.
+        # Static objects need the vertex data though, a build that dropped it is read again
+        built = Mesh._source_registry.get(source_key)
+        if built is not None and not (game_object.static and any(entry["vertices"] is None for entry in built)):
+            return [Submesh.from_built(game_object, entry) for entry in built]
+
+        mesh_data = Mesh._decoded.pop(source_key, None)
+        if mesh_data is None:
+            mesh_data = Mesh._read_mesh_data(asset_path)
 
-                            if vt is not None:
-                                u, v_ = tex_coords[vt]
-                            else:
-                                u, v_ = 0.0, 0.0
+        submeshes = []
+        for data in mesh_data:
+            if Mesh.COMPACT_VERTICES:
+                data = data.compacted()
+
+            # Arrays mapped from a file cost nothing to keep, parsed ones are dropped once they're on the GPU
+            # unless static batching will need them
+            keep_data = (isinstance(data.vertices, np.memmap) or not data.vertices.flags.owndata
+                         or game_object.static or source_key[:2] in Mesh.static_sources)
+            submeshes.append(Submesh.from_data(game_object, data, keep_data))
+
+        # Older versions of this mesh won't be asked for again
+        for key in [key for key in Mesh._source_registry if key[:2] == source_key[:2]]:
+            del Mesh._source_registry[key]
+        Mesh._source_registry[source_key] = [submesh.built_entry() for submesh in submeshes]
+
+        return submeshes
+
+    def _update_bounds(self):
+        # Bounding sphere around every submesh, in local space, used to pick the LOD
+        if not self.submeshes:
+            self._bounds_center = glm.vec3(0)
+            self._bounds_radius = 0.0
+            return
 
-                            if vn is not None:
-                                nx, ny, nz = normals[vn]
-                            else:
-                                nx, ny, nz = 0.0, 0.0, 0.0
+        bounds_min = np.min([submesh.bounds[0] for submesh in self.submeshes], axis=0)
+        bounds_max = np.max([submesh.bounds[1] for submesh in self.submeshes], axis=0)
 
-                            vertex_map[key] = len(vertices) // 8
-                            vertices.extend([
-                                px, py, pz,
-                                nx, ny, nz,
-                                u, v_
-                            ])
+        self._bounds_center = glm.vec3(*((bounds_min + bounds_max) / 2).tolist())
+        self._bounds_radius = float(np.linalg.norm(bounds_max - bounds_min)) / 2
 
-                        indices.append(vertex_map[key])
+    def select_lod(self, view_pos: glm.vec3, projection: glm.mat4) -> int:
+        """
+            Returns the LOD level to draw this frame from how much of the screen's height the mesh's bounding sphere covers.
+        """
+        if not any(submesh.lods for submesh in self.submeshes):
+            return 0
 
-        cur_mesh.indices = indices
-        cur_mesh.vertices = vertices
+        model = self.gameobject.transform.get_model_matrix()
+        center = glm.vec3(model * glm.vec4(self._bounds_center, 1.0))
+        scale = max(glm.length(glm.vec3(model[0])), glm.length(glm.vec3(model[1])), glm.length(glm.vec3(model[2])))
 
-        cur_mesh._create_or_get_buffers()
+        # projection[1][1] is cot(fov / 2), turning radius over distance into a fraction of the half height
+        distance = max(glm.length(center - view_pos), 1e-4)
+        screen_size = self._bounds_radius * scale * projection[1][1] / distance
 
-        submeshes.append(cur_mesh)
+        if screen_size < self.lod2_screen_size:
+            return 2
+        if screen_size < self.lod1_screen_size:
+            return 1
+        return 0
 
+    @InitMethod
+    def create_from_obj(cls, file_path: str, file_name: str, game_object: Object):
         mesh = cls(game_object)
-        mesh.submeshes = submeshes
+        mesh.submeshes = Mesh._load_submeshes(file_path, file_name, game_object)
+        mesh._update_bounds()
 
         mesh.mesh_name = file_name
         mesh.mesh_path = file_path
@@ -144,114 +212,42 @@ class Mesh(Behavior):
 
     @create_from_obj.refresh_vars
     def reload_obj(self, file_path, file_name):
-        submeshes = []
-        cur_mesh = None
-
-        positions = []
-        normals = []
-        tex_coords = []
-
-        vertices = []   # interleaved vertex data
-        indices = []
-
-        vertex_map = {}  # (v, vt, vn) -> index
-
-        pos_offset = 0
-        nor_offset = 0
-        tex_offset = 0
-
-        lines = []
-        if not "compiled" in os.environ.keys():
-            with open(os.path.join(*file_path.split("."), file_name)) as file:
-                lines = file.readlines()
-        else:
-            pack = Pack()
-            lines = pack.get_string(os.path.join(*file_path.split("."), file_name)).splitlines()
-
-        for line in lines:
-            if line.startswith("o "):
-                if cur_mesh:
-                    cur_mesh.indices = indices
-                    cur_mesh.vertices = vertices
-
-                    cur_mesh._create_or_get_buffers()
-
-                    submeshes.append(cur_mesh)
-                
-                pos_offset = len(positions)
-                nor_offset = len(normals)
-                tex_offset = len(tex_coords)
-
-                positions.clear()
-                normals.clear()
-                tex_coords.clear()
-
-                vertices.clear()
-                indices.clear()
-
-                vertex_map.clear()
-
-                cur_mesh = Submesh(self.gameobject)
-
-            elif line.startswith("v "):
-                positions.append(tuple(map(float, line.split()[1:4])))
-
-            elif line.startswith("vn "):
-                normals.append(tuple(map(float, line.split()[1:4])))
-
-            elif line.startswith("vt "):
-                tex_coords.append(tuple(map(float, line.split()[1:3])))
-
-            elif line.startswith("f "):
-                face = line.split()[1:]
-
-                # triangulate face (fan method)
-                for i in range(1, len(face) - 1):
-                    for vert in (face[0], face[i], face[i + 1]):
-
-                        parts = vert.split("/")
-                        v = int(parts[0]) - 1 - pos_offset
-                        vt = int(parts[1]) - 1 - tex_offset if len(parts) > 1 and parts[1] else None
-                        vn = int(parts[2]) - 1 - nor_offset if len(parts) > 2 and parts[2] else None
-
-                        key = (v, vt, vn)
-                        if key not in vertex_map:
-                            px, py, pz = positions[v]
-
-                            if vt is not None:
-                                u, v_ = tex_coords[vt]
-                            else:
-                                u, v_ = 0.0, 0.0
-
-                            if vn is not None:
-                                nx, ny, nz = normals[vn]
-                            else:
-                                nx, ny, nz = 0.0, 0.0, 0.0
-
-                            vertex_map[key] = len(vertices) // 8
-                            vertices.extend([
-                                px, py, pz,
-                                nx, ny, nz,
-                                u, v_
-                            ])
-
-                        indices.append(vertex_map[key])
-
-        cur_mesh.indices = indices
-        cur_mesh.vertices = vertices
-
-        cur_mesh._create_or_get_buffers()
-
-        submeshes.append(cur_mesh)
-
-        self.submeshes = submeshes
+        old_submeshes = self.submeshes
+        self.submeshes = Mesh._load_submeshes(file_path, file_name, self.gameobject)
+        self._update_bounds()
+
+        for submesh in old_submeshes:
+            submesh.release()
+
+    def on_destroy(self):
+        for submesh in self.submeshes:
+            submesh.release()
+
+    def static_geometry(self) -> list[tuple[Material, SubmeshData]] | None:
+        """
+            Returns the full detail submeshes with the material each is drawn with, for static batching.
+            None when the vertex data is no longer kept on the CPU.
+        """
+        geometry = []
+        for submesh in self.submeshes:
+            if submesh.vertices is None or submesh.indices is None:
+                return None
+
+            material = submesh.render_mat or self.gameobject.mat
+            geometry.append((material, SubmeshData("", submesh.vertices, submesh.indices, submesh.layout)))
+
+        return geometry
     
     def update(self, dt):
-        if not self.enabled:
+        if not self.enabled or self.batched:
             return
         
+        from ..core.scene_manager import SceneManager
+        scene_manager = SceneManager()
+        lod = self.select_lod(scene_manager.view_pos, scene_manager.projection)
+
         for mesh in self.submeshes:
-            mesh.update()
+            mesh.update(lod)
 
 class Submesh:
     def __init__(self, gameobject):
@@ -259,24 +255,81 @@ class Submesh:
         
         self.vertices = None
         self.indices = None
+        self.layout = LAYOUT_FLOAT
+        self.bounds = (np.zeros(3, np.float32), np.zeros(3, np.float32))
+
+        # Simplified versions, LOD 1 first, drawn in place of this one by update
+        self.lods: list["Submesh"] = []
+        self.lod_level = 0
         self.mesh_id = None
+        self._mesh_id = None
+        self._vao = None
         self.vao = None
         self.vbo = None
         self.ebo = None
 
         self.render_mat: Material = None
 
+    @staticmethod
+    def from_data(gameobject, data: SubmeshData, keep_data: bool = True) -> "Submesh":
+        """
+            Creates a submesh and its LODs from mesh data, uploading whatever isn't on the GPU yet.
+            Without keep_data, vertices and indices are only held until the upload.
+        """
+        submesh = Submesh(gameobject)
+        submesh.vertices = data.vertices
+        submesh.indices = data.indices
+        submesh.layout = data.layout
+        submesh.bounds = data.bounds
+        submesh.lod_level = data.lod_level
+
+        # Still content hashed, so identical meshes from different files share buffers too
+        submesh._create_or_get_buffers()
+
+        if not keep_data:
+            submesh.vertices = None
+            submesh.indices = None
+
+        submesh.lods = [Submesh.from_data(gameobject, lod, keep_data) for lod in data.lods]
+        return submesh
+
+    @staticmethod
+    def from_built(gameobject, entry: dict) -> "Submesh":
+        """Creates a submesh sharing the data and buffers of a built_entry."""
+        submesh = Submesh(gameobject)
+        submesh.vertices = entry["vertices"]
+        submesh.indices = entry["indices"]
+        submesh.layout = entry["layout"]
+        submesh.bounds = entry["bounds"]
+        submesh.lod_level = entry["lod_level"]
+        submesh._use_buffers(entry["mesh_id"])
+
+        submesh.lods = [Submesh.from_built(gameobject, lod) for lod in entry["lods"]]
+        return submesh
+
+    def built_entry(self) -> dict:
+        return {
+            "vertices": self.vertices, "indices": self.indices, "layout": self.layout, "lod_level": self.lod_level,
+            "mesh_id": self._mesh_id, "bounds": self.bounds,
+            "lods": [lod.built_entry() for lod in self.lods]
+        }
+
     def _create_or_get_buffers(self):
         """Creates or retrieves shared VAO/VBO/EBO for this mesh data."""
         if self.vertices is None or self.indices is None:
             Logger("CORE").log_fatal("Mesh vertices or indices not set.")
 
         # Generate a hash of the vertex/index data
-        mesh_data = (
-            np.array(self.vertices).tobytes() +
-            np.array(self.indices).tobytes()
-        )
-        mesh_id = hashlib.sha1(mesh_data).hexdigest()
+        if self.layout == LAYOUT_COMPACT:
+            vertex_data = np.ascontiguousarray(self.vertices, dtype=COMPACT_VERTEX_DTYPE)
+        else:
+            vertex_data = np.ascontiguousarray(self.vertices, dtype=np.float32)
+
+        # Hashed piece by piece, joining the buffers would briefly double the mesh in memory
+        mesh_hash = hashlib.sha1(bytes([self.layout]))
+        mesh_hash.update(vertex_data.view(np.uint8))
+        mesh_hash.update(np.ascontiguousarray(self.indices).view(np.uint8))
+        mesh_id = mesh_hash.hexdigest()
 
         if mesh_id in Mesh._mesh_registry:
             shared = Mesh._mesh_registry[mesh_id]
@@ -285,56 +338,173 @@ class Submesh:
             vbo = GL.glGenBuffers(1)
             ebo = GL.glGenBuffers(1)
 
-            GL.glBindVertexArray(vao)
+            render_state = RenderState()
+            render_state.bind_vertex_array(vao)
 
             # Upload vertex data (interleaved layout: pos, normal, uv)
-            vertex_data = np.array(self.vertices, dtype=np.float32)
-            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vbo)
-            GL.glBufferData(GL.GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data, GL.GL_STATIC_DRAW)
-
-            # Upload index data
-            index_data = np.array(self.indices, dtype=np.uint32)
-            GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, ebo)
+            render_state.bind_buffer(GL.GL_ARRAY_BUFFER, vbo)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data.view(np.uint8), GL.GL_STATIC_DRAW)
+
+            # Upload index data, cooked meshes keep 16-bit indices when they fit
+            index_data = np.ascontiguousarray(self.indices)
+            if index_data.dtype not in (np.uint16, np.uint32):
+                index_data = index_data.astype(np.uint32)
+            render_state.bind_buffer(GL.GL_ELEMENT_ARRAY_BUFFER, ebo)
             GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, index_data.nbytes, index_data, GL.GL_STATIC_DRAW)
 
-            stride = 8 * 4  # 8 floats per vertex * 4 bytes = 32 bytes
+            Submesh._set_vertex_attributes(self.layout)
+
+            index_type = GL.GL_UNSIGNED_SHORT if index_data.dtype == np.uint16 else GL.GL_UNSIGNED_INT
+            shared = {"vao": vao, "vbo": vbo, "ebo": ebo, "count": len(index_data), "index_type": index_type, "layout": self.layout}
+            Mesh._mesh_registry[mesh_id] = shared
+
+            def delete():
+                GL.glDeleteVertexArrays(1, [vao])
+                GL.glDeleteBuffers(2, [vbo, ebo])
+                if "instance_vbo" in shared:
+                    GL.glDeleteBuffers(1, [shared["instance_vbo"]])
+
+                render_state = RenderState()
+                render_state.forget_vertex_array(vao)
+                for buffer in (vbo, ebo, shared.get("instance_vbo")):
+                    render_state.forget_buffer(buffer)
+
+                def uses_buffers(entry: dict) -> bool:
+                    return entry["mesh_id"] == mesh_id or any(uses_buffers(lod) for lod in entry["lods"])
+
+                del Mesh._mesh_registry[mesh_id]
+                for key, built in list(Mesh._source_registry.items()):
+                    if any(uses_buffers(entry) for entry in built):
+                        del Mesh._source_registry[key]
+
+            GPUResources().add(("mesh", mesh_id), "mesh", vertex_data.nbytes + index_data.nbytes, vertex_data.nbytes + index_data.nbytes, delete)
+
+        self._use_buffers(mesh_id)
+
+    @staticmethod
+    def _set_vertex_attributes(layout: int):
+        """Describes the bound vertex buffer to the bound VAO."""
+        if layout == LAYOUT_COMPACT:
+            stride = COMPACT_VERTEX_DTYPE.itemsize  # 12 + 4 + 4 = 20 bytes
 
-            # --- vertex attributes ---
             # position (vec3) at location=0
             GL.glEnableVertexAttribArray(0)
             GL.glVertexAttribPointer(0, 3, GL.GL_FLOAT, GL.GL_FALSE, stride, GL.ctypes.c_void_p(0))
 
-            # normal (vec3) at location=1
+            # normal (signed normalized 10:10:10:2, the shader reads xyz) at location=1
             GL.glEnableVertexAttribArray(1)
-            GL.glVertexAttribPointer(1, 3, GL.GL_FLOAT, GL.GL_FALSE, stride, GL.ctypes.c_void_p(3 * 4))
+            GL.glVertexAttribPointer(1, 4, GL.GL_INT_2_10_10_10_REV, GL.GL_TRUE, stride, GL.ctypes.c_void_p(12))
 
-            # texcoord (vec2) at location=2
+            # texcoord (half vec2) at location=2
             GL.glEnableVertexAttribArray(2)
-            GL.glVertexAttribPointer(2, 2, GL.GL_FLOAT, GL.GL_FALSE, stride, GL.ctypes.c_void_p(6 * 4))
+            GL.glVertexAttribPointer(2, 2, GL.GL_HALF_FLOAT, GL.GL_FALSE, stride, GL.ctypes.c_void_p(16))
+            return
 
-            GL.glBindVertexArray(0)
+        stride = 8 * 4  # 8 floats per vertex * 4 bytes = 32 bytes
 
-            shared = {"vao": vao, "vbo": vbo, "ebo": ebo, "count": len(self.indices)}
-            Mesh._mesh_registry[mesh_id] = shared
+        # --- vertex attributes ---
+        # position (vec3) at location=0
+        GL.glEnableVertexAttribArray(0)
+        GL.glVertexAttribPointer(0, 3, GL.GL_FLOAT, GL.GL_FALSE, stride, GL.ctypes.c_void_p(0))
+
+        # normal (vec3) at location=1
+        GL.glEnableVertexAttribArray(1)
+        GL.glVertexAttribPointer(1, 3, GL.GL_FLOAT, GL.GL_FALSE, stride, GL.ctypes.c_void_p(3 * 4))
+
+        # texcoord (vec2) at location=2
+        GL.glEnableVertexAttribArray(2)
+        GL.glVertexAttribPointer(2, 2, GL.GL_FLOAT, GL.GL_FALSE, stride, GL.ctypes.c_void_p(6 * 4))
 
+    def _use_buffers(self, mesh_id: str):
+        """Points this submesh at buffers already in the registry."""
+        shared = Mesh._mesh_registry[mesh_id]
+
+        self.layout = shared["layout"]
         self._mesh_id = mesh_id
         self._vao = shared["vao"]
         self._vbo = shared["vbo"]
         self._ebo = shared["ebo"]
 
-    def update(self):
+        GPUResources().acquire(("mesh", mesh_id))
+
+    def release(self):
+        """Drops this submesh's use of its buffers, they're deleted on the next collect once unused."""
+        if self._mesh_id is not None:
+            GPUResources().release(("mesh", self._mesh_id))
+            self._mesh_id = None
+
+        for lod in self.lods:
+            lod.release()
+
+    def update(self, lod: int = 0):
         if self._vao is None:
             Logger("CORE").log_warning("SubMesh.update called before buffers created. Creating now.")
             self._create_or_get_buffers()
 
-        if self.render_mat:
-            self.render_mat.use()
+        # Simplified levels are drawn with this submesh's object and material. A level that was never generated
+        # is stood in for by the closest finer one
+        target = self
+        for level in self.lods:
+            if level.lod_level <= lod:
+                target = level
+        shared = Mesh._mesh_registry[target._mesh_id]
 
+        material = self.render_mat or self.gameobject.mat
         model = self.gameobject.transform.get_model_matrix()
-        self.gameobject.mat.shader.set_mat4("uModel", model)
-
-        GL.glBindVertexArray(self._vao)
-        count = Mesh._mesh_registry[self._mesh_id]["count"]
-        GL.glDrawElements(GL.GL_TRIANGLES, count, GL.GL_UNSIGNED_INT, None)
-        GL.glBindVertexArray(0)
 
+        # Drawn once every object has updated, sorted with everything else in the frame
+        RenderQueue().submit(material, shared, model)
+
+class StaticBatch:
+    """
+        Geometry of static objects sharing a material, pre-transformed to world space at scene load and
+        drawn with a single call. The objects it was built from must not move or be disabled afterwards.
+    """
+    def __init__(self, material: Material, data: SubmeshData):
+        self.material = material
+        self.material.acquire()
+
+        # Uploaded like any other mesh, so its buffers are tracked by GPUResources too
+        self.submesh = Submesh.from_data(None, data, keep_data=False)
+
+    @staticmethod
+    def build(objects: list[Object]) -> list["StaticBatch"]:
+        """
+            Merges the meshes of every enabled static object into one batch per material and marks them as batched.
+        """
+        parts: dict[Material, list] = {}
+        meshes = []
+        for obj in objects:
+            if not obj.static or not obj.enabled:
+                continue
+
+            for mesh in obj.get_components(Mesh):
+                geometry = mesh.static_geometry()
+                if geometry is None:
+                    Logger("CORE").log_warning(f"Mesh of {obj.name} has no vertex data left to batch, it's drawn on its own.")
+                    continue
+
+                model = np.array(obj.transform.get_model_matrix().to_list(), dtype=np.float64).T
+
+                # A zero (or next to zero) scale on an axis leaves no inverse to transform the normals with
+                if np.linalg.cond(model[:3, :3]) > 1 / np.finfo(np.float32).eps:
+                    Logger("CORE").log_warning(f"{obj.name} is scaled flat, it's drawn on its own instead of batched.")
+                    continue
+
+                for material, data in geometry:
+                    parts.setdefault(material, []).append((data, model))
+                meshes.append(mesh)
+
+        batches = [StaticBatch(material, merge_static_geometry("static", material_parts)) for material, material_parts in parts.items()]
+
+        for mesh in meshes:
+            mesh.batched = True
+
+        return batches
+
+    def submit(self):
+        RenderQueue().submit(self.material, Mesh._mesh_registry[self.submesh._mesh_id], glm.mat4(1))
+
+    def release(self):
+        self.submesh.release()
+        self.material.release()
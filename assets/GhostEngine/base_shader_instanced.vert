@@ -0,0 +1,27 @@
+#version 330 core
+
+layout (location = 0) in vec3 aPos;
+layout (location = 1) in vec3 aNormal;
+layout (location = 2) in vec2 aTexCoord;
+
+// Per instance, takes locations 3 to 6 (one per column)
+layout (location = 3) in mat4 aModel;
+
+uniform mat4 uView;
+uniform mat4 uProjection;
+
+out vec3 vWorldPos;
+out vec3 vNormal;
+out vec2 vTexCoord;
+
+void main()
+{
+    vec4 worldPos = aModel * vec4(aPos, 1.0);
+    vWorldPos = worldPos.xyz;
+
+    mat3 normalMatrix = transpose(inverse(mat3(aModel)));
+    vNormal = normalize(normalMatrix * aNormal);
+
+    vTexCoord = aTexCoord;
+    gl_Position = uProjection * uView * worldPos;
+}
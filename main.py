@@ -3,16 +3,22 @@ import RoDevEngine
 import RoDevEngine.core.logger as logger
 import RoDevEngine.core.settings
 
-settings = RoDevEngine.core.settings.Settings()
-win_width = int(settings.get_setting("window_width", 800))
-win_height = int(settings.get_setting("window_height", 600))
+import multiprocessing
 
-RoDevEngine.set_logging_level(RoDevEngine.LoggingLevels.DEBUG)
-window = RoDevEngine.init(window_width=win_width, window_height=win_height)
+if __name__ == "__main__":
+    # Scene loading parses meshes in worker processes, which import this file again
+    multiprocessing.freeze_support()
 
-while not window.should_close():
-    window.update()
+    settings = RoDevEngine.core.settings.Settings()
+    win_width = int(settings.get_setting("window_width", 800))
+    win_height = int(settings.get_setting("window_height", 600))
 
-window.terminate()
+    RoDevEngine.set_logging_level(RoDevEngine.LoggingLevels.DEBUG)
+    window = RoDevEngine.init(window_width=win_width, window_height=win_height)
 
-settings.save_config()
\ No newline at end of file
+    while not window.should_close():
+        window.update()
+
+    window.terminate()
+
+    settings.save_config()
\ No newline at end of file